@@ -0,0 +1,2554 @@
+import argparse
+import contextlib
+import errno
+import hashlib
+import time
+import io
+import mmap
+import os
+import sys
+import threading
+import string
+import random
+import re
+import shutil
+import signal
+import json
+import csv
+import zlib
+
+from collections import Counter, defaultdict, namedtuple
+from subprocess import Popen, PIPE, DEVNULL
+
+# numpy, asyncio, multiprocessing, sqlite3 & tempfile are imported by the functions using them:
+# together they are most of the start-up time, which the list subcommand and shell loops notice.
+
+skip_student_list = ["mihai.nan", "roxana.pavelescu1307"]
+
+class LazyRegex:
+    # compiled on first use, most invocations only need a few of the module's patterns; the
+    # compiled pattern's methods are then cached on the instance, later calls skip __getattr__
+    def __init__(self, pattern, flags = 0):
+        self.pattern_args = (pattern, flags)
+
+    def __getattr__(self, name):
+        value = getattr(re.compile(*self.pattern_args), name)
+        setattr(self, name, value)
+        return value
+
+DuplDetails = namedtuple('DuplDetails', 'file1 lines1 file2 lines2 tokens_count')
+VariableDetails = namedtuple('VariableDetails', 'file line name type')
+FunctionDetails = namedtuple('FunctionDetails', 'file line length name type')
+
+MANUAL_TAG = "[TODO remove if not applicable]" + ("=" * 5)
+
+meaningless_name_regex = LazyRegex(r'^(?:[A-Za-z]\d+|(?:var|func|functie|fct|f)\d+)$')
+snake_case_regex = LazyRegex(r'^[a-z][a-z0-9]*(?:_[a-z0-9]+)+$')
+camel_case_regex = LazyRegex(r'^[a-z]+[0-9]*(?:[A-Z][a-z0-9]*)+$')
+
+# The rubric (penalties, their thresholds & messages, naming word lists, manual checks) lives in
+# rubric.json; an assignment can override any part of it with a rubric.json in its assignments
+# path. It is compiled once per run into a rule table keyed by grade record category, e.g.
+# "duplication" or "style:LONG_LINE": a rule's penalty applies when its count exceeds the threshold,
+# or for "at_most" rules (README size in bytes) while the count is at most the threshold. Manual
+# checks are named, so an override can reword one by its name, or drop it with null.
+RUBRIC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rubric.json")
+ASSIGNMENT_RUBRIC_FILE = "rubric.json"
+
+RubricRule = namedtuple('RubricRule', 'message penalty threshold at_most')
+rubric = {}
+
+def merge_rubric(rubric_spec, override):
+    merged = dict(rubric_spec)
+    for (key, value) in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = merge_rubric(merged[key], value)
+        merged[key] = value
+    return merged
+
+def load_rubric(path, assignments_path = None):
+    with open(path, encoding="utf-8") as rubric_file:
+        rubric_spec = json.load(rubric_file)
+    if assignments_path is not None:
+        override_path = os.path.join(assignments_path, ASSIGNMENT_RUBRIC_FILE)
+        if os.path.isfile(override_path):
+            with open(override_path, encoding="utf-8") as override_file:
+                rubric_spec = merge_rubric(rubric_spec, json.load(override_file))
+    return rubric_spec
+
+def compile_rubric(rubric_spec):
+    rules = {}
+    for (category, rule) in rubric_spec.items():
+        if category == "style":
+            for (code, code_rule) in rule.items():
+                rules["style:" + code] = RubricRule(code_rule["message"], code_rule["penalty"],
+                                                    code_rule["threshold"], code_rule.get("at_most", False))
+        elif isinstance(rule, dict) and "penalty" in rule:
+            rules[category] = RubricRule(rule["message"], rule["penalty"], rule["threshold"],
+                                         rule.get("at_most", False))
+    return {
+        "spec" : rubric_spec,
+        "rules" : rules,
+        "style_and_readme" : rubric_spec["style_and_readme"],
+        "function_max_length" : rubric_spec["long_functions"]["max_length"],
+        # single letter names that are conventional (loop counters, coordinates, sizes, chars)
+        "allowed_short_names" : frozenset(rubric_spec["bad_names"]["allowed_short_names"]),
+        "meaningless_names" : frozenset(rubric_spec["bad_names"]["meaningless_names"]),
+        "manual_checks" : [(check, manually_checked_error)
+                           for (check, manually_checked_error) in rubric_spec["manual_checks"].items()
+                           if manually_checked_error is not None],
+        # manual checks that asses_vars_and_funcs_namings does from the AST whenever clang could parse the sources
+        "naming_manual_checks" : frozenset(rubric_spec["naming_manual_checks"]),
+    }
+
+def apply_rubric(rubric_spec):
+    rubric.clear()
+    rubric.update(compile_rubric(rubric_spec))
+
+def rule_applies(rule, count):
+    return count <= rule.threshold if rule.at_most else count > rule.threshold
+
+def rule_penalty(rule, count):
+    return rule.penalty if rule_applies(rule, count) else 0.0
+
+def ignore_students(student_hw_path):
+    in_skip_list = any(skiped_students in student_hw_path for skiped_students in skip_student_list)
+    return in_skip_list
+
+def skip_students(student_hw_path):
+    contains_space =  "*" in student_hw_path
+    return contains_space
+
+def list_files(d):
+    return [os.path.join(d, f) for f in os.listdir(d) if os.path.isfile(os.path.join(d, f))]
+
+def list_dirs(d):
+    # sorted so the round-robin TA assignment does not depend on the filesystem order
+    return [os.path.join(d, f) for f in sorted(os.listdir(d)) if os.path.isdir(os.path.join(d, f))]
+
+SOURCE_SUFFIXES = (".c", ".h")
+
+def list_sources(d):
+    return [os.path.join(d, f) for f in os.listdir(d) if os.path.isfile(os.path.join(d, f)) \
+            and f.endswith(SOURCE_SUFFIXES)]
+
+def list_files_recursive(d):
+    return sorted(os.path.join(root, f) for (root, dirs, files) in os.walk(d) for f in files)
+
+# The files of a student's archive, classified the way the stages look at them. Built with a
+# single scandir per directory of the archive (the submissions live on NFS, where every stat is
+# a round-trip) and shared by all the stages and the cohort prefetch. The classified lists hold
+# the top level files, files holds every file of the tree, sorted like list_files_recursive.
+ArchiveInventory = namedtuple('ArchiveInventory', 'path sources readmes makefiles unrelated sizes files')
+
+archive_inventories = {}
+
+def archive_inventory(student_files_path):
+    student_files_path = student_files_path.rstrip("/")
+    inventory = archive_inventories.get(student_files_path)
+    if inventory is not None:
+        return inventory
+
+    sources, readmes, makefiles, unrelated, files = [], [], [], [], []
+    sizes = {}
+
+    def scan_subdirectory(directory):
+        # the same files os.walk lists: symlinked directories are not followed, unreadable ones skipped
+        try:
+            with os.scandir(directory) as entries:
+                subdirectory_entries = list(entries)
+        except OSError:
+            return
+        for entry in subdirectory_entries:
+            if not entry.is_dir():
+                files.append(entry.path)
+            elif not entry.is_symlink():
+                scan_subdirectory(entry.path)
+
+    with os.scandir(student_files_path) as entries:
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    scan_subdirectory(entry.path)
+                continue
+            files.append(entry.path)
+            if not entry.is_file():
+                continue
+            path = os.path.join(student_files_path, entry.name)
+            sizes[path] = entry.stat().st_size
+            name = entry.name.lower()
+            if entry.name.endswith(SOURCE_SUFFIXES):
+                sources.append(path)
+            elif "readme" in name:
+                readmes.append(path)
+            elif "makefile" in name:
+                makefiles.append(path)
+            else:
+                unrelated.append(path)
+    files.sort()
+    inventory = ArchiveInventory(student_files_path, sources, readmes, makefiles, unrelated, sizes, files)
+    archive_inventories[student_files_path] = inventory
+    return inventory
+
+# On-disk cache of parsed external tool results, keyed by the hash of the inspected files
+# contents, the tool version and its flags. Entries are json files, evicted in LRU order
+# (mtime is refreshed on every hit) once the cache grows over max_bytes.
+result_cache = {
+    "enabled" : True,
+    "dir" : os.path.join(os.path.expanduser("~"), ".cache", "auto-grader"),
+    "max_bytes" : 512 * 1024 * 1024,
+}
+
+TOOL_VERSION_COMMANDS = {
+    "sim_c" : ["sim_c", "-v"],
+    "clang" : ["clang", "--version"],
+}
+tool_versions = {}
+
+grader_options = {
+    "duplication_engine" : "native",
+    "style_engine" : "checkpatch",
+}
+
+def tool_version(tool):
+    if tool in tool_versions:
+        return tool_versions[tool]
+    version = hashlib.sha256()
+    if tool == "checkpatch":
+        # the wrapper holds the flags and checkpatch.pl has no usable --version, hash both
+        for path in [CHECKPATCH_WRAPPER, shutil.which("checkpatch.pl")]:
+            try:
+                with open(path, "rb") as file:
+                    version.update(file.read())
+            except (TypeError, OSError):
+                version.update(b"missing")
+    else:
+        try:
+            process = Popen(TOOL_VERSION_COMMANDS[tool], stdout=PIPE, stderr=PIPE)
+            (output, err) = process.communicate()
+            version.update(output + err)
+        except OSError:
+            version.update(b"missing")
+    tool_versions[tool] = version.hexdigest()
+    return tool_versions[tool]
+
+def cache_key(tool, flags, files_paths):
+    key = hashlib.sha256()
+    key.update(("%s\0%s\0%s\0" % (tool, tool_version(tool), " ".join(flags))).encode())
+    for path in files_paths:
+        key.update(path.encode(errors="replace") + b"\0")
+        with open(path, "rb") as file:
+            key.update(hashlib.sha256(count_bytes_read(file.read())).digest())
+    return key.hexdigest()
+
+def cache_entry_path(key):
+    return os.path.join(result_cache["dir"], key[:2], key + ".json")
+
+def cache_load(key):
+    path = cache_entry_path(key)
+    try:
+        with open(path, "r") as file:
+            result = json.load(file)
+        os.utime(path)
+        return result
+    except (OSError, ValueError):
+        return None
+
+def cache_store(key, result):
+    path = cache_entry_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write & rename so concurrent workers never read a partial entry
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as file:
+            json.dump(result, file)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+def cache_lookup(tool, flags, files_paths):
+    # -> (key, cached result or None), the key is None when nothing can be cached
+    if not result_cache["enabled"]:
+        return None, None
+    try:
+        key = cache_key(tool, flags, files_paths)
+    except OSError:
+        return None, None
+    return key, cache_load(key)
+
+def cached_tool_result(tool, flags, files_paths, compute):
+    key, result = cache_lookup(tool, flags, files_paths)
+    if result is None:
+        result = compute()
+        if key is not None:
+            cache_store(key, result)
+    return result
+
+def trim_cache():
+    if not result_cache["enabled"]:
+        return
+    entries = []
+    for path in list_files_recursive(result_cache["dir"]):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for (mtime, size, path) in entries)
+    for (mtime, size, path) in sorted(entries):
+        if total_size <= result_cache["max_bytes"]:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
+
+# Per stage instrumentation: the counters are reset by profiled_stage and bumped by the
+# helpers that start external tools or read student files.
+stage_counters = {"subprocesses" : 0, "bytes_read" : 0, "exit_codes" : []}
+profile_records = []
+
+def count_subprocess(exit_code):
+    stage_counters["subprocesses"] += 1
+    stage_counters["exit_codes"].append(exit_code)
+
+def count_bytes_read(data):
+    stage_counters["bytes_read"] += len(data)
+    return data
+
+@contextlib.contextmanager
+def profiled_stage(student_id, stage):
+    stage_counters.update(subprocesses = 0, bytes_read = 0, exit_codes = [])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile_records.append({
+            "student" : student_id,
+            "stage" : stage,
+            "seconds" : time.perf_counter() - start,
+            "subprocesses" : stage_counters["subprocesses"],
+            "bytes_read" : stage_counters["bytes_read"],
+            "exit_codes" : stage_counters["exit_codes"],
+        })
+
+def record_tool_run(stage, run_owners, seconds, exit_code):
+    # a tool run of the cohort prefetch, profiled as part of the stage of the students owning its
+    # files (one entry per file): a checkpatch batch shared by several students is split between
+    # them by file count, the subprocess itself is counted once, for the owner of the first file
+    for (student_id, files_count) in Counter(run_owners).items():
+        first = student_id == run_owners[0]
+        profile_records.append({
+            "student" : student_id,
+            "stage" : stage,
+            "seconds" : seconds * files_count / len(run_owners),
+            "subprocesses" : 1 if first else 0,
+            "bytes_read" : 0,
+            "exit_codes" : [exit_code] if first else [],
+        })
+
+def merge_profile_records(records):
+    # one record per student & stage: the prefetched tool runs are added to their owner's stage
+    merged = {}
+    for record in records:
+        key = (record["student"], record["stage"])
+        if key not in merged:
+            merged[key] = dict(record, exit_codes = list(record["exit_codes"]))
+            continue
+        for counter in ["seconds", "subprocesses", "bytes_read", "exit_codes"]:
+            merged[key][counter] += record[counter]
+    return list(merged.values())
+
+def profile_summary(records, slowest_count = 10):
+    import numpy as np
+    stages = defaultdict(list)
+    students = defaultdict(float)
+    for record in records:
+        stages[record["stage"]].append(record)
+        # <cohort>, <unit> & <chunk> time the prefetch as a whole, they are not submissions
+        if not record["student"].startswith("<"):
+            students[record["student"]] += record["seconds"]
+
+    summary = {"stages" : {}, "slowest_students" : []}
+    for (stage, stage_records) in stages.items():
+        seconds = np.array([record["seconds"] for record in stage_records])
+        summary["stages"][stage] = {
+            "calls" : len(stage_records),
+            "total_seconds" : round(float(seconds.sum()), 3),
+            "p50_seconds" : round(float(np.percentile(seconds, 50)), 3),
+            "p95_seconds" : round(float(np.percentile(seconds, 95)), 3),
+            "subprocesses" : sum(record["subprocesses"] for record in stage_records),
+            "bytes_read" : sum(record["bytes_read"] for record in stage_records),
+            "failed_exit_codes" : sum(code != 0 for record in stage_records for code in record["exit_codes"]),
+        }
+    slowest = sorted(students.items(), key=lambda entry: -entry[1])[:slowest_count]
+    summary["slowest_students"] = [{"student" : student, "seconds" : round(seconds, 3)}
+                                   for (student, seconds) in slowest]
+    return summary
+
+def write_profile(path, records):
+    records = merge_profile_records(records)
+    summary = profile_summary(records)
+    for (stage, totals) in sorted(summary["stages"].items(), key=lambda entry: -entry[1]["total_seconds"]):
+        print("%-32s %8.2fs total  p50 %6.3fs  p95 %6.3fs  %5d subprocesses  %10d bytes read" % (
+            stage, totals["total_seconds"], totals["p50_seconds"], totals["p95_seconds"],
+            totals["subprocesses"], totals["bytes_read"]))
+    print("Slowest students:", " ".join("%s(%.1fs)" % (entry["student"], entry["seconds"])
+                                         for entry in summary["slowest_students"]))
+
+    if path.endswith(".json"):
+        with open(path, "w") as file:
+            json.dump(summary, file, indent=1)
+        return
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["student", "stage", "seconds", "subprocesses", "bytes_read", "exit_codes"])
+        for record in records:
+            writer.writerow([record["student"], record["stage"], "%.6f" % record["seconds"],
+                             record["subprocesses"], record["bytes_read"],
+                             " ".join(map(str, record["exit_codes"]))])
+
+# External checkers are always started through run_tool (blocking) or run_tool_async (the
+# cohort prefetch), sandboxed by TOOL_LIMITS: a run over its wall clock budget or output cap is
+# killed, the CPU time and address space are bounded by rlimits. Any tripped limit is reported
+# as a ToolFailure, which the stage turns into a "[TODO check manually]" line.
+ToolLimits = namedtuple('ToolLimits', 'wall_seconds cpu_seconds memory_bytes output_bytes')
+TOOL_LIMITS = {
+    "checkpatch" : ToolLimits(120, 300, 2 << 30, 64 << 20),
+    "sim_c" : ToolLimits(60, 60, 1 << 30, 16 << 20),
+    "clang" : ToolLimits(60, 60, 4 << 30, 512 << 20),
+}
+TOOL_MAX_LINE = 1 << 20
+TOOL_READ_SIZE = 1 << 16
+
+class ToolFailure(Exception):
+    pass
+
+# The rlimits are set by a shell exec-ing the tool: a preexec_fn would run Python between fork and
+# exec, which is unsafe with the prefetch and coordinator threads around. The CPU soft limit
+# (SIGXCPU) goes one second before the hard one (SIGKILL), and is lowered first.
+TOOL_RLIMITS_SCRIPT = 'ulimit -S -t %d; ulimit -H -t %d; ulimit -v %d; exec "$@"'
+
+def limited_command(tool, cmd_line):
+    limits = TOOL_LIMITS[tool]
+    # a missing tool must still fail to start with an OSError, not as sh's exit code 127
+    executable = shutil.which(cmd_line[0])
+    if executable is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), cmd_line[0])
+    script = TOOL_RLIMITS_SCRIPT % (limits.cpu_seconds, limits.cpu_seconds + 1, limits.memory_bytes >> 10)
+    return ["/bin/sh", "-c", script, tool, executable] + list(cmd_line[1:])
+
+def kill_tool(process):
+    # tools run in their own session: the wrapper scripts' children (perl, sleep..) die too
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def check_tool_exit(tool, exit_code, killed_for):
+    limits = TOOL_LIMITS[tool]
+    if killed_for is not None:
+        raise ToolFailure("%s %s" % (tool, killed_for))
+    # a signal death, directly or reported by a wrapper shell as 128 + signal
+    signal_number = -exit_code if exit_code < 0 else exit_code - 128 if exit_code > 128 else 0
+    if signal_number == signal.SIGXCPU:
+        raise ToolFailure("%s used more than %ds of CPU time" % (tool, limits.cpu_seconds))
+    if signal_number > 0:
+        try:
+            signal_name = signal.Signals(signal_number).name
+        except ValueError:
+            signal_name = "signal %d" % (signal_number)
+        # an allocation failing under RLIMIT_AS usually ends in SIGSEGV/SIGABRT, but so does a plain crash
+        raise ToolFailure("%s killed by %s (possibly its %d MB memory limit)" % (tool, signal_name,
+                          limits.memory_bytes >> 20))
+
+def run_tool(tool, cmd_line, line_consumer = None):
+    # Without a line_consumer the whole stdout is returned, otherwise it is fed line by line.
+    limits = TOOL_LIMITS[tool]
+    process = Popen(limited_command(tool, cmd_line), stdout=PIPE, stderr=DEVNULL, start_new_session=True)
+    killed_for = []
+
+    def kill(reason):
+        killed_for.append(reason)
+        kill_tool(process)
+
+    timer = threading.Timer(limits.wall_seconds, kill, ["timed out after %ds" % (limits.wall_seconds)])
+    timer.start()
+    try:
+        chunks, output_size = [], 0
+        if line_consumer is None:
+            read = lambda: process.stdout.read1(TOOL_READ_SIZE)
+        else:
+            read = lambda: process.stdout.readline(TOOL_MAX_LINE)
+        for data in iter(read, b""):
+            output_size += len(data)
+            if output_size > limits.output_bytes:
+                kill("printed more than %d MB" % (limits.output_bytes >> 20))
+                break
+            if line_consumer is None:
+                chunks.append(data)
+            else:
+                line_consumer(data)
+        process.stdout.close()
+        exit_code = process.wait()
+    finally:
+        timer.cancel()
+    count_subprocess(exit_code)
+    check_tool_exit(tool, exit_code, killed_for[0] if killed_for else None)
+    return (b"".join(chunks) if line_consumer is None else None), exit_code
+
+async def run_tool_async(semaphore, tool, cmd_line, line_consumer = None, stage = None, run_owners = ()):
+    import asyncio
+    limits = TOOL_LIMITS[tool]
+    async with semaphore:
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(*limited_command(tool, cmd_line), stdout=PIPE,
+                                                       stderr=DEVNULL, limit=TOOL_MAX_LINE,
+                                                       start_new_session=True)
+
+        async def read_output():
+            chunks, output_size = [], 0
+            while True:
+                if line_consumer is None:
+                    data = await process.stdout.read(TOOL_READ_SIZE)
+                else:
+                    data = await process.stdout.readline()
+                if not data:
+                    return b"".join(chunks) if line_consumer is None else None
+                output_size += len(data)
+                if output_size > limits.output_bytes:
+                    raise OverflowError()
+                if line_consumer is None:
+                    chunks.append(data)
+                else:
+                    line_consumer(data)
+
+        killed_for = None
+        output = None
+        try:
+            output = await asyncio.wait_for(read_output(), limits.wall_seconds)
+        except asyncio.TimeoutError:
+            killed_for = "timed out after %ds" % (limits.wall_seconds)
+        except OverflowError:
+            killed_for = "printed more than %d MB" % (limits.output_bytes >> 20)
+        except ValueError:
+            killed_for = "printed a line over %d bytes" % (TOOL_MAX_LINE)
+        if killed_for is not None:
+            kill_tool(process)
+        exit_code = await process.wait()
+        if stage is not None:
+            record_tool_run(stage, run_owners, time.perf_counter() - start, exit_code)
+    count_subprocess(exit_code)
+    check_tool_exit(tool, exit_code, killed_for)
+    return output, exit_code
+
+# What the stages grade: every line of the text grade file comes with a record, so totals and
+# cohort queries never have to parse the Romanian text back. The penalty is the signed amount
+# printed on the line (bonus lines are positive).
+GradeRecord = namedtuple('GradeRecord', 'category penalty count examples')
+
+class GradeSheet(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.todo = []
+        self.manual_checks = []
+        # set by asses_vars_and_funcs_namings once it covered the naming manual checks
+        self.naming_checked = False
+
+    def add_record(self, line, category, penalty, count = 1, examples = ()):
+        self.write(line)
+        self.records.append(GradeRecord(category, round(penalty, 1), count, list(examples)))
+
+    def add_todo(self, line, reason):
+        self.write(line)
+        self.todo.append(reason)
+
+    def add_manual_check(self, manually_checked_error):
+        spaces = (40 - len(manually_checked_error)) * " "
+        self.write(manually_checked_error + spaces + MANUAL_TAG + "\n")
+        self.manual_checks.append(manually_checked_error)
+
+    def student_record(self, student_id, ta):
+        return {"student" : student_id, "ta" : ta,
+                "total" : round(sum(record.penalty for record in self.records), 1),
+                "records" : [record._asdict() for record in self.records],
+                "todo" : self.todo, "manual_checks" : self.manual_checks}
+
+# Submissions and logs are scanned through read-only memory maps: runaway student programs can
+# print hundreds of MB and archives can hold big generated files. Only the pages being scanned
+# are resident (clean file pages the kernel can drop again) and only the matched pieces are
+# copied into Python objects, so many students graded in parallel keep a bounded resident set.
+SCAN_MAX_LINE = 1 << 16
+SCAN_WINDOW = 1 << 22
+
+@contextlib.contextmanager
+def mapped_file(path):
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b"" # empty files cannot be mapped
+            return
+        with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            yield count_bytes_read(mapped)
+
+def release_scanned(mapped, end):
+    # drops the pages before end from the resident set: they are clean file pages, touching
+    # them again would simply map them back from the page cache
+    end = min(end, len(mapped))
+    end -= end % mmap.PAGESIZE
+    if end > 0 and hasattr(mmap, "MADV_DONTNEED"):
+        mapped.madvise(mmap.MADV_DONTNEED, 0, end)
+
+def mapped_lines(mapped, max_line = SCAN_MAX_LINE):
+    # same pieces as iterating file.readline(max_line): lines keep their b"\n", longer ones are split
+    position, size = 0, len(mapped)
+    next_release = SCAN_WINDOW
+    while position < size:
+        end = mapped.find(b"\n", position, position + max_line)
+        end = position + max_line if end < 0 else end + 1
+        yield mapped[position:min(end, size)]
+        position = end
+        if position >= next_release:
+            release_scanned(mapped, position)
+            next_release = position + SCAN_WINDOW
+
+def mapped_last_line(mapped, max_line = SCAN_MAX_LINE):
+    # same line as readlines()[-1], cut to its last max_line bytes
+    end = len(mapped)
+    if mapped[end - 1:end] == b"\n":
+        end -= 1
+    return mapped[max(mapped.rfind(b"\n", 0, end) + 1, end - max_line):end]
+
+def mapped_count_lines_with(mapped, marker):
+    count = 0
+    next_release = SCAN_WINDOW
+    position = mapped.find(marker)
+    while position >= 0:
+        count += 1
+        line_end = mapped.find(b"\n", position)
+        if line_end < 0:
+            break
+        if line_end >= next_release:
+            release_scanned(mapped, line_end)
+            next_release = line_end + SCAN_WINDOW
+        position = mapped.find(marker, line_end + 1)
+    return count
+
+def mapped_search(mapped, regex, overlap = SCAN_MAX_LINE):
+    # regex.search over the whole mapping, one window at a time; matches are expected to be
+    # shorter than overlap
+    size = len(mapped)
+    for start in range(0, size, SCAN_WINDOW):
+        if regex.search(mapped, start, min(size, start + SCAN_WINDOW + overlap)) is not None:
+            return True
+        release_scanned(mapped, start + SCAN_WINDOW)
+    return False
+
+test_result_regex = LazyRegex(rb'^\s*(.*?)[\s.:=-]*\b(PASSED|FAILED)\b')
+
+def scan_run_output(student_files_output_path):
+    # -> (points, leaks, {test name : passed}) of a run-stdout.vmr log
+    points = 0
+    leaks = 0
+    tests = {}
+    try:
+        with mapped_file(student_files_output_path) as mapped:
+            points = int(mapped_last_line(mapped).split(b"=")[1])
+
+            previous_line = None
+            # a "Memory leaks" line is counted only when the next line reports the test as PASSED
+            for line in mapped_lines(mapped):
+                if previous_line in (b"Memory leaks\n", b"Memory leaks\r\n") and b"PASSED" in line:
+                    leaks += 1
+                previous_line = line
+
+                match = test_result_regex.match(line)
+                if match is not None:
+                    tests[match.group(1).decode(errors="replace")] = match.group(2) == b"PASSED"
+    except (ValueError, IndexError, FileNotFoundError) as e:
+        pass
+    return points, leaks, tests
+
+def failed_tests_leaks(student_files_output_path):
+    points, leaks, tests = scan_run_output(student_files_output_path)
+    return 110 - points, leaks
+
+def assess_leaks_failed_tests(grade_file, student_hw_path, verbose=True):
+    failed, leaks = failed_tests_leaks(student_hw_path + "/current/results/run-stdout.vmr")
+    if failed > 0:
+        line = "-%0.1f: teste picate\n" % (failed / 10.0)
+        grade_file.add_record(line, "failed_tests", -failed / 10.0, failed)
+    if leaks > 0:
+        leak_penalty = leaks / 20.0 * (110 - failed) / 100
+        line = "-%0.1f: leak-uri de memorie\n" % (leak_penalty)
+        grade_file.add_record(line, "memory_leaks", -leak_penalty, leaks)
+
+    if verbose:
+        print("<failed: %3.1lf leaks: %2.1lf>\t" % (failed, leaks), end="")
+
+# checkpatch is started once per batch of files instead of once per file: most of its
+# run time is the Perl interpreter start-up and loading of spelling.txt & regex tables.
+CHECKPATCH_BATCH_SIZE = 256
+CHECKPATCH_WRAPPER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpatch_wrapper.sh")
+# --terse --show-types lines: "path/file.c:12: WARNING:LONG_LINE: line length of 90 exceeds 80 columns"
+checkpatch_line_regex = LazyRegex(rb'^(.+?):(\d+): ([A-Z]+):(\w+): ?(.*?)\r?\n?$')
+
+class CheckpatchFinding:
+    # many thousands of these are kept per cohort: no per instance dict, interned kind & code
+    __slots__ = ('location', 'kind', 'code', 'message')
+
+    def __init__(self, location, kind, code, message):
+        self.location = location
+        self.kind = sys.intern(kind)
+        self.code = sys.intern(code)
+        self.message = message
+
+    def as_list(self):
+        return [self.location, self.kind, self.code, self.message]
+
+# source file path (as passed to checkpatch) -> [CheckpatchFinding]
+checkpatch_results = {}
+
+def checkpatch_output_parser(files_paths):
+    # -> (feed, findings): feed takes checkpatch's stdout line by line, as bytes
+    findings = {path : [] for path in files_paths}
+    file_names = {}
+
+    def feed(check_line):
+        match = checkpatch_line_regex.match(check_line)
+        if match is None:
+            return
+        # fsdecode maps the path back to the exact str it was passed as, even if not utf-8
+        src_file = os.fsdecode(match.group(1))
+        if src_file not in findings:
+            return
+        if src_file not in file_names:
+            file_names[src_file] = src_file.split("/")[-1] + ":"
+        findings[src_file].append(CheckpatchFinding(file_names[src_file] + match.group(2).decode(),
+                                                    match.group(3).decode(), match.group(4).decode(),
+                                                    match.group(5).decode("utf-8", errors="replace")))
+
+    return feed, findings
+
+def run_checkpatch(files_absolute_paths):
+    feed, findings = checkpatch_output_parser(files_absolute_paths)
+    run_tool("checkpatch", [CHECKPATCH_WRAPPER] + files_absolute_paths, feed)
+    return findings
+
+def checkpatch_pending(files_paths):
+    # -> (files still to be linted, their cache keys); findings found in the cache are loaded
+    pending, cache_keys = [], {}
+    for path in files_paths:
+        if path in checkpatch_results:
+            continue
+        key, findings = cache_lookup("checkpatch", [], [path])
+        if findings is not None:
+            checkpatch_results[path] = [CheckpatchFinding(*finding) for finding in findings]
+            continue
+        pending.append(path)
+        if key is not None:
+            cache_keys[path] = key
+    return pending, cache_keys
+
+def checkpatch_batches(files_paths):
+    return [files_paths[i:i + CHECKPATCH_BATCH_SIZE]
+            for i in range(0, len(files_paths), CHECKPATCH_BATCH_SIZE)]
+
+def store_checkpatch_findings(batch_findings, cache_keys):
+    checkpatch_results.update(batch_findings)
+    for path in batch_findings:
+        if path in cache_keys:
+            cache_store(cache_keys[path], [finding.as_list() for finding in batch_findings[path]])
+
+def prefetch_checkpatch(files_paths):
+    pending, cache_keys = checkpatch_pending(files_paths)
+    for batch in checkpatch_batches(pending):
+        store_checkpatch_findings(run_checkpatch(batch), cache_keys)
+
+# Built-in linter for the checkpatch codes that carry a penalty. It follows the checkpatch
+# rules closely enough for grading (see --style_conformance) at a fraction of the cost of
+# starting Perl: comments, strings & preprocessor lines are blanked out in one regex pass,
+# then every line is checked on the sanitized text.
+NATIVE_STYLE_CODES = ["DEEP_INDENTATION", "GLOBAL_INITIALISERS", "LONG_LINE", "LONG_LINE_COMMENT",
+                      "SPACING", "TRAILING_STATEMENTS"]
+STYLE_MAX_LINE_LENGTH = 80  # also passed as --max-line-length by checkpatch_wrapper.sh
+STYLE_DEEP_INDENTATION_TABS = 6
+
+style_literal_regex = LazyRegex(r"""
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<preprocessor>^[ \t]*\#(?:\\\n|[^\n])*)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+""", re.VERBOSE | re.DOTALL | re.MULTILINE)
+style_operator_regex = LazyRegex(r'<<=|>>=|->|\+\+|--|&&|\|\||<<|>>|[=!<>+\-*/%&|^]=|[-+*/%&|^<>=!~?:,;]')
+style_spaced_operators = frozenset(["=", "==", "!=", "<", ">", "<=", ">=", "&&", "||", "+=", "-=",
+                                    "*=", "/=", "%=", "&=", "|=", "^=", "<<=", ">>="])
+style_binary_operators = frozenset(["+", "-", "/", "%", "^", "|", "<<", ">>"])
+style_conditional_regex = LazyRegex(r'^\s*(?:\}\s*)?(?:else\s+)?(?:if|for|while)\s*\(')
+style_else_regex = LazyRegex(r'^\s*(?:\}\s*)?else\b(.*)$')
+style_nested_regex = LazyRegex(r'^\s*(?:\}\s*)?(?:if|else|for|while|do|switch)\b')
+style_keyword_paren_regex = LazyRegex(r'\b(?:if|for|while|switch)\(')
+style_open_brace_regex = LazyRegex(r'\)\{|\b(?:else|do)\{')
+style_close_brace_regex = LazyRegex(r'\}[^\s,;)}]')
+style_open_paren_regex = LazyRegex(r'\((?!\s+;)\s+\S')
+style_close_paren_regex = LazyRegex(r'[^\s;:]\s+\)')
+style_string_only_regex = LazyRegex(r'^\s*"x*"\s*[,;)]*\s*$')
+style_global_init_regex = LazyRegex(r'^(?!(?:return|else|case|goto|typedef|extern)\b)'
+                                    r'(?:(static)\s+)?(?:[A-Za-z_]\w*\s+)+\**\s*[A-Za-z_]\w*'
+                                    r'(?:\s*\[[^\]]*\])*\s*=\s*((?:0[xX])?0+[uUlL]*|NULL|false)\s*;')
+
+def sanitize_c_source(source):
+    # same length & line breaks as the source: comments and preprocessor lines become blanks,
+    # string and char literal contents become 'x'
+    pieces, last = [], 0
+    for match in style_literal_regex.finditer(source):
+        pieces.append(source[last:match.start()])
+        text = match.group()
+        if match.lastgroup == "string":
+            pieces.append(text[0] + "x" * (len(text) - 2) + text[-1])
+        else:
+            pieces.append(re.sub(r'[^\n]', " ", text))
+        last = match.end()
+    pieces.append(source[last:])
+    return "".join(pieces)
+
+def unary_position(line, start):
+    # whether the operator at start has no left operand (e.g. -1, return -x)
+    before = line[:start].rstrip()
+    if not before or not (before[-1].isalnum() or before[-1] in "_)]\"'"):
+        return True
+    word = re.search(r'[A-Za-z_]\w*$', before)
+    return word is not None and word.group() in C_KEYWORDS
+
+def spacing_context(line, start, end):
+    left = "W" if start == 0 or line[start - 1] in " \t" else "V"
+    right = "E" if end == len(line) or line[end:].strip() in ("", "\\") else \
+            "W" if line[end] in " \t" else "V"
+    return left + "x" + right
+
+def operator_spacing_errors(line):
+    for match in style_operator_regex.finditer(line):
+        op, start, end = match.group(), match.start(), match.end()
+        ctx = spacing_context(line, start, end)
+        if op in style_spaced_operators:
+            if ctx[0] != "W" or ctx[2] == "V":
+                yield "spaces required around that '%s' (ctx:%s)" % (op, ctx)
+        elif op == ",":
+            if ctx[0] == "W" and line[:start].strip():
+                yield "space prohibited before that ',' (ctx:%s)" % ctx
+            if ctx[2] == "V" and line[end] != "}":
+                yield "space required after that ',' (ctx:%s)" % ctx
+        elif op == ";":
+            if ctx[2] == "V" and line[end] not in ");}\\":
+                yield "space required after that ';' (ctx:%s)" % ctx
+        elif op in style_binary_operators and not unary_position(line, start):
+            if ctx in ("WxV", "VxW"):
+                yield "need consistent spacing around '%s' (ctx:%s)" % (op, ctx)
+
+def line_spacing_errors(line):
+    if style_keyword_paren_regex.search(line):
+        yield "space required before the open parenthesis '('"
+    if style_open_brace_regex.search(line):
+        yield "space required before the open brace '{'"
+    if style_close_brace_regex.search(line):
+        yield "space required after that close brace '}'"
+    if style_open_paren_regex.search(line):
+        yield "space prohibited after that open parenthesis '('"
+    if style_close_paren_regex.search(line):
+        yield "space prohibited before that close parenthesis ')'"
+    yield from operator_spacing_errors(line)
+
+def condition_end(text, open_paren):
+    # offset after the parenthesis closing the one at open_paren, or None if unbalanced
+    depth = 0
+    for offset in range(open_paren, len(text)):
+        if text[offset] == "(":
+            depth += 1
+        elif text[offset] == ")":
+            depth -= 1
+            if depth == 0:
+                return offset + 1
+    return None
+
+def has_trailing_statement(sanitized, line_start, line):
+    conditional = style_conditional_regex.match(line)
+    if conditional is not None and not re.match(r'^\s*\}\s*while\b', line):
+        end = condition_end(sanitized, line_start + conditional.end() - 1)
+        if end is not None:
+            line_end = sanitized.find("\n", end)
+            rest = sanitized[end:line_end if line_end >= 0 else len(sanitized)]
+            if not re.match(r'^\s*\{?\s*\\?\s*$', rest):
+                return True
+    otherwise = style_else_regex.match(line)
+    return otherwise is not None and not re.match(r'^(?:\s+if\b|\s*\{?\s*\\?\s*$)', otherwise.group(1))
+
+def native_style_check(source_file_path):
+    with open(source_file_path, errors="replace") as source_file:
+        source = source_file.read()
+    count_bytes_read(source)
+    name = source_file_path.split("/")[-1] + ":"
+    sanitized = sanitize_c_source(source)
+
+    findings = []
+    def report(line_no, kind, code, message):
+        findings.append(CheckpatchFinding(name + str(line_no), kind, code, message))
+
+    line_start = 0
+    for line_no, (raw_line, line) in enumerate(zip(source.split("\n"), sanitized.split("\n")), 1):
+        length = len(raw_line.rstrip("\r").expandtabs(8))
+        if length > STYLE_MAX_LINE_LENGTH:
+            code = "LONG_LINE"
+            if not line.strip():
+                code = "LONG_LINE_COMMENT"
+            elif style_string_only_regex.match(line):
+                code = "LONG_LINE_STRING"
+            report(line_no, "WARNING", code,
+                   "line length of %d exceeds %d columns" % (length, STYLE_MAX_LINE_LENGTH))
+
+        if line.strip():
+            indent = len(line) - len(line.lstrip(" \t"))
+            if len(line[:indent].expandtabs(8)) // 8 >= STYLE_DEEP_INDENTATION_TABS \
+                and style_nested_regex.match(line):
+                report(line_no, "WARNING", "DEEP_INDENTATION", "Too many leading tabs - consider code refactoring")
+            initialiser = style_global_init_regex.match(line)
+            if initialiser is not None:
+                if initialiser.group(1):
+                    report(line_no, "ERROR", "INITIALISED_STATIC",
+                           "do not initialise statics to %s" % initialiser.group(2))
+                else:
+                    report(line_no, "ERROR", "GLOBAL_INITIALISERS",
+                           "do not initialise globals to %s" % initialiser.group(2))
+            if has_trailing_statement(sanitized, line_start, line):
+                report(line_no, "ERROR", "TRAILING_STATEMENTS", "trailing statements should be on next line")
+            for message in line_spacing_errors(line):
+                report(line_no, "ERROR", "SPACING", message)
+        line_start += len(line) + 1
+
+    return findings
+
+def style_findings(source_file_path):
+    if grader_options["style_engine"] == "native":
+        return native_style_check(source_file_path)
+    return checkpatch_results[source_file_path]
+
+def run_check_per_stud(student_files_path):
+    warnings = defaultdict(lambda:[])
+    errors = defaultdict(lambda:[])
+
+    sources = archive_inventory(student_files_path).sources
+    if grader_options["style_engine"] == "checkpatch":
+        prefetch_checkpatch(sources)
+    for source_file_path in sources:
+        for finding in style_findings(source_file_path):
+            store_dict = warnings
+            if finding.kind == 'ERROR':
+                store_dict = errors
+            store_dict[finding.code].append((finding.location, finding.message))
+
+    if "SPACING" in warnings:
+        del warnings['SPACING']
+
+    return warnings, errors, len(sources)
+
+def absolute_subsampling(lst, count = 2):
+    import numpy as np
+    lst = [sample[0] for sample in lst]
+    count = min(len(lst), count)
+    if count <= 0:
+        return ""
+    samples = np.random.choice(lst, count)
+    samples = set(samples)
+    return " ".join(samples)
+
+def output_check_summary(file, summaries, allowed_penalty = 0.5):
+    # one pass over the findings of every summary (checkpatch warnings, then errors); codes
+    # missing from the rubric are not reported and penalties stop once allowed_penalty is reached
+    rules = rubric["rules"]
+    cumulated_penalty = 0.0
+    for summary in summaries:
+        for (problem_summary, problem_occurences) in summary.items():
+            rule = rules.get("style:" + problem_summary)
+            if rule is None:
+                continue
+
+            penalty = rule_penalty(rule, len(problem_occurences))
+            if cumulated_penalty + penalty > allowed_penalty:
+                penalty = 0.0
+
+            examples = absolute_subsampling(problem_occurences)
+            line = "-%2.1f: %s X %d e.g. %s\n" % (penalty, rule.message, len(problem_occurences), examples)
+            cumulated_penalty += penalty
+            file.add_record(line, "style:" + problem_summary, -penalty, len(problem_occurences), examples.split())
+    return cumulated_penalty
+
+def assess_coding_style(grade_file, student_hw_path, verbose=True):
+    style_and_readme = rubric["style_and_readme"]
+    line = "+%.1f: %s\n" % (style_and_readme["points"], style_and_readme["message"])
+    grade_file.add_record(line, "style_and_readme", style_and_readme["points"])
+
+    warnings, errors, file_count = run_check_per_stud(student_hw_path + "/current/git/archive")
+    total_pen = output_check_summary(grade_file, [warnings, errors], style_and_readme["max_penalty"])
+
+    if (file_count == 1):
+        rule = rubric["rules"]["single_source_file"]
+        penalty = rule_penalty(rule, file_count)
+        line = "-%.1f: %s\n" % (penalty, rule.message)
+        grade_file.add_record(line, "single_source_file", -penalty)
+
+    if verbose:
+        print("<style errors & warnings: %2.1lf>\t" % (total_pen), end="")
+    return total_pen
+
+def style_conformance(args):
+    # diffs the native linter against checkpatch on every source of the assignment
+    sources = []
+    for stud_path in list_dirs(args.assignments_path):
+        if not skip_students(stud_path) and not ignore_students(stud_path):
+            sources += archive_inventory(stud_path + "/current/git/archive").sources
+    prefetch_checkpatch(sources)
+
+    agreed, checkpatch_only, native_only = Counter(), Counter(), Counter()
+    with open(args.style_conformance, "w") as report:
+        for source_file_path in sources:
+            reference = Counter((finding.location, finding.code) for finding in checkpatch_results[source_file_path]
+                                if finding.code in NATIVE_STYLE_CODES)
+            native = Counter((finding.location, finding.code) for finding in native_style_check(source_file_path)
+                             if finding.code in NATIVE_STYLE_CODES)
+            for ((location, code), count) in sorted((reference & native).items()):
+                agreed[code] += count
+            for ((location, code), count) in sorted((reference - native).items()):
+                checkpatch_only[code] += count
+                report.write("checkpatch only %s %s: %s X %d\n" % (code, source_file_path, location, count))
+            for ((location, code), count) in sorted((native - reference).items()):
+                native_only[code] += count
+                report.write("native only %s %s: %s X %d\n" % (code, source_file_path, location, count))
+
+    print("%-20s %8s %16s %12s" % ("code", "agreed", "checkpatch only", "native only"))
+    for code in NATIVE_STYLE_CODES:
+        print("%-20s %8d %16d %12d" % (code, agreed[code], checkpatch_only[code], native_only[code]))
+    print("Compared %d sources -> %s" % (len(sources), args.style_conformance))
+
+def compile_warnings(student_files_build_output_path):
+    warnings = 0
+    try:
+        with mapped_file(student_files_build_output_path) as mapped:
+            warnings = mapped_count_lines_with(mapped, b"warning:")
+    except FileNotFoundError as e:
+        pass
+    return warnings
+
+def assess_compile_warnings(grade_file, student_hw_path, verbose=True):
+    cwarns = compile_warnings(student_hw_path + "/current/results/run-stderr.vmr")
+    if cwarns > 0:
+        rule = rubric["rules"]["compile_warnings"]
+        penalty = rule_penalty(rule, cwarns)
+        line = "-%1.1f: %s\n" % (penalty, rule.message)
+        grade_file.add_record(line, "compile_warnings", -penalty, cwarns)
+
+    if verbose:
+        print("<compilation: %.1lf>\t" % (cwarns), end="")
+
+readme_feedback_regex = LazyRegex(rb'feedback', re.IGNORECASE)
+
+def check_for_readme(student_files_readme_dir):
+    readme_size = 0
+    contains_feedback = False
+    inventory = archive_inventory(student_files_readme_dir)
+    for source_file_path in inventory.readmes:
+        readme_size = inventory.sizes[source_file_path]
+        try:
+            with mapped_file(source_file_path) as mapped:
+                contains_feedback = mapped_search(mapped, readme_feedback_regex)
+        except OSError:
+            pass
+    return readme_size, contains_feedback
+
+def assess_readme(grade_file, student_hw_path, verbose=True):
+    readme_size, contains_feedback = check_for_readme(student_hw_path + "/current/git/archive");
+
+    rule = rubric["rules"]["readme"]
+    if rule_applies(rule, readme_size):
+        line = "-%.1f: %s\n" % (rule.penalty, rule.message)
+        grade_file.add_record(line, "readme", -rule.penalty, examples = ["%d bytes" % readme_size])
+
+    if contains_feedback:
+        line = "+0.0: Multumim pentru feedback ! \(ᵔᵕᵔ)/\n"
+        grade_file.add_record(line, "readme_feedback", 0.0)
+
+    if verbose:
+        log_readme = "<readme: " + str(readme_size) + "> " + ("F" if contains_feedback else "")
+        log_readme += " " * (20 - len(log_readme))
+        print(log_readme, end="\t")
+
+def check_arh_structure(student_files_path):
+    return len(archive_inventory(student_files_path).unrelated)
+
+def asses_arh_content(grade_file, student_hw_path, verbose = True):
+    unrelated_files = check_arh_structure(student_hw_path +  "/current/git/archive")
+    if verbose:
+        print("<unrelated files:", unrelated_files, ">\t", end="")
+    if unrelated_files > 0:
+        rule = rubric["rules"]["unrelated_files"]
+        penalty = rule_penalty(rule, unrelated_files)
+        line = "-%.1f: %s\n" % (penalty, rule.message)
+        grade_file.add_record(line, "unrelated_files", -penalty, unrelated_files)
+
+SIM_C_FLAGS = ["-w100", "-a", "-R", "-n", "-f"]
+
+similarity_delimiters_regex = '|'.join(map(re.escape, ["archive", "|", "line"]))
+
+# student path -> sim_c summaries, filled by the cohort prefetch
+similarity_results = {}
+# (tool, student or source path) -> why the prefetched tool run failed
+tool_failures = {}
+
+def similarity_command(student_files_path):
+    return ["sim_c"] + SIM_C_FLAGS + [student_files_path + "/current/git/archive/"]
+
+def run_similary_check_cmd(student_files_path):
+    output, exit_code = run_tool("sim_c", similarity_command(student_files_path))
+    return output
+
+def summarize_dup(tokens):
+    if len(tokens) < 6:
+        return
+    try:
+        file1 = tokens[1][1:-2]
+        lines1 = tuple(map(int, tokens[2].split("-")))
+
+        file2 = tokens[4][1:-2]
+        lines2, token_count = tokens[5][:-1].split("[")
+        lines2 = tuple(map(int, lines2.split("-")))
+        token_count = int(token_count)
+    except (ValueError, IndexError) as e:
+        print("Error parsing similiarity tool output")
+        return
+    return DuplDetails(file1, lines1, file2, lines2, token_count)
+
+def parse_similarity_output(output):
+    duplications = str(output).split("\\n")
+    summaries = [summarize_dup(re.split(similarity_delimiters_regex, duplication_line))
+                 for duplication_line in duplications]
+    return [summary for summary in summaries if summary is not None]
+
+def overlaps(a, b):
+    return max(0, min(a[1], b[1]) - max(a[0], b[0]))
+
+def interval_size(i):
+    return i[1] - i[0]
+
+C_KEYWORDS = frozenset([
+    "auto", "break", "case", "char", "const", "continue", "default", "do", "double", "else",
+    "enum", "extern", "float", "for", "goto", "if", "inline", "int", "long", "register",
+    "restrict", "return", "short", "signed", "sizeof", "static", "struct", "switch", "typedef",
+    "union", "unsigned", "void", "volatile", "while", "_Bool",
+])
+
+c_token_regex = LazyRegex(r"""
+      (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<preprocessor>^[ \t]*\#(?:\\\n|[^\n])*)
+    | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    | (?P<number>\.?[0-9](?:[eEpP][+-]|[\w.])*)
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<newline>\n)
+    | (?P<operator>->|\+\+|--|<<=|>>=|<<|>>|&&|\|\||[-+*/%&|^!=<>]=?|[][(){};,.?:~])
+""", re.S | re.M | re.X)
+
+CToken = namedtuple('CToken', 'kind line')
+
+def tokenize_c(source, normalize = True):
+    # With normalize, identifiers & literals become V/N/S so renaming variables does not hide
+    # a copy; comments and preprocessor lines are always dropped.
+    tokens = []
+    line = 1
+    for match in c_token_regex.finditer(source):
+        group = match.lastgroup
+        text = match.group()
+        if group == "name":
+            tokens.append(CToken(text if not normalize or text in C_KEYWORDS else "V", line))
+        elif group == "number":
+            tokens.append(CToken("N" if normalize else text, line))
+        elif group == "string":
+            tokens.append(CToken("S" if normalize else text, line))
+        elif group == "operator":
+            tokens.append(CToken(text, line))
+        line += text.count("\n")
+    return tokens
+
+def tokenize_c_file(source_file_path, normalize = True):
+    with open(source_file_path, "r", errors="replace") as file:
+        return tokenize_c(count_bytes_read(file.read()), normalize)
+
+HASH_MODULO = (1 << 61) - 1
+HASH_BASE = 1000003
+token_ids = {}
+
+def token_id(token):
+    # crc32 instead of hash() so ids are the same in every (worker) process
+    if token not in token_ids:
+        token_ids[token] = zlib.crc32(token.encode()) + 1
+    return token_ids[token]
+
+def kgram_hashes(tokens, k):
+    # Karp-Rabin rolling hash of every k consecutive tokens
+    if len(tokens) < k:
+        return []
+    ids = [token_id(token.kind) for token in tokens]
+    top = pow(HASH_BASE, k - 1, HASH_MODULO)
+    value = 0
+    for i in range(k):
+        value = (value * HASH_BASE + ids[i]) % HASH_MODULO
+    hashes = [value]
+    for i in range(k, len(ids)):
+        value = ((value - ids[i - k] * top) * HASH_BASE + ids[i]) % HASH_MODULO
+        hashes.append(value)
+    return hashes
+
+def winnow(hashes, window):
+    # Keeps the rightmost minimal hash of every window of hashes (Schleimer et al. winnowing);
+    # any match of at least window + k - 1 tokens shares at least one selected fingerprint.
+    fingerprints = []
+    last_selected = -1
+    if not hashes:
+        # a source shorter than one k-gram (small headers) has nothing to fingerprint
+        return fingerprints
+    for start in range(max(1, len(hashes) - window + 1)):
+        end = min(start + window, len(hashes))
+        selected = start
+        for i in range(start, end):
+            if hashes[i] <= hashes[selected]:
+                selected = i
+        if selected != last_selected:
+            fingerprints.append((hashes[selected], selected))
+            last_selected = selected
+    return fingerprints
+
+# Same role as sim_c's minimum run size: shorter common token runs are not reported.
+DUPLICATION_MIN_RUN = 24
+DUPLICATION_MAX_BUCKET = 64
+
+def find_duplicated_runs(student_files_path):
+    # In-process replacement of sim_c: every DUPLICATION_MIN_RUN tokens window is hashed, windows
+    # with equal hashes seed a match which is then extended to the longest common token run.
+    tokens, owners, names = [], [], []
+    for source_file_path in archive_inventory(student_files_path).files:
+        if not source_file_path.endswith(SOURCE_SUFFIXES):
+            continue
+        try:
+            file_tokens = tokenize_c_file(source_file_path, normalize = False)
+        except OSError:
+            continue
+        owners += [len(names)] * len(file_tokens)
+        tokens += file_tokens
+        names.append(os.path.relpath(source_file_path, student_files_path))
+
+    buckets = defaultdict(list)
+    start = 0
+    for (idx, name) in enumerate(names):
+        end = start
+        while end < len(owners) and owners[end] == idx:
+            end += 1
+        for (offset, value) in enumerate(kgram_hashes(tokens[start:end], DUPLICATION_MIN_RUN)):
+            buckets[value].append(start + offset)
+        start = end
+
+    summaries = []
+    for positions in buckets.values():
+        if len(positions) < 2 or len(positions) > DUPLICATION_MAX_BUCKET:
+            continue
+        for (i, q) in enumerate(positions):
+            for p in positions[i + 1:]:
+                # only report maximal runs, not every shifted window of the same run
+                if q > 0 and owners[q - 1] == owners[q] and owners[p - 1] == owners[p] \
+                    and tokens[q - 1].kind == tokens[p - 1].kind:
+                    continue
+                length = 0
+                while p + length < len(tokens) and owners[p + length] == owners[p] \
+                    and owners[q + length] == owners[q] and tokens[p + length].kind == tokens[q + length].kind \
+                    and (owners[p] != owners[q] or q + length < p):
+                    length += 1
+                if length < DUPLICATION_MIN_RUN:
+                    continue
+                summaries.append(DuplDetails(names[owners[q]], (tokens[q].line, tokens[q + length - 1].line),
+                                             names[owners[p]], (tokens[p].line, tokens[p + length - 1].line),
+                                             length))
+    return summaries
+
+def check_code_similarity(student_hw_path):
+    def is_valid_duplication(details):
+        DUPLICATED_LINES_COUNT_THRESHOLD = 5
+        DUPLICATED_TOKENS_COUNT_THRESHOLD = 10
+
+        if details is None:
+            return False
+
+        ignorable = False
+        ignorable_contained_tokens = [".ref", "tests/", "test", ".in", "~", ".txt", ".pdf", ".py", ".sh"]
+        for token in ignorable_contained_tokens:
+            ignorable = ignorable or (token in details.file1 or token in details.file2)
+        if ignorable:
+            return False
+
+        if min(interval_size(details.lines1), interval_size(details.lines2)) <= DUPLICATED_LINES_COUNT_THRESHOLD:
+            return False
+
+        if details.file1 == details.file2 and overlaps(details.lines1, details.lines2) > 0:
+            return False
+
+        if details.tokens_count <= DUPLICATED_TOKENS_COUNT_THRESHOLD:
+            return False
+
+        return True
+
+    if grader_options["duplication_engine"] == "sim_c":
+        if ("sim_c", student_hw_path) in tool_failures:
+            raise ToolFailure(tool_failures[("sim_c", student_hw_path)])
+        summaries = similarity_results.get(student_hw_path)
+        if summaries is None:
+            summaries = cached_tool_result("sim_c", SIM_C_FLAGS,
+                                           archive_inventory(student_hw_path + "/current/git/archive").files,
+                                           lambda: parse_similarity_output(run_similary_check_cmd(student_hw_path)))
+    else:
+        summaries = find_duplicated_runs(student_hw_path + "/current/git/archive/")
+    signficant_duplicated_patches = []
+    for (file1, lines1, file2, lines2, tokens_count) in summaries:
+        duplication_summary = DuplDetails(file1, tuple(lines1), file2, tuple(lines2), tokens_count)
+        if is_valid_duplication(duplication_summary):
+            signficant_duplicated_patches.append(duplication_summary)
+
+    return signficant_duplicated_patches
+
+def asses_duplication(grade_file, student_hw_path, verbose = True):
+    DUPLICATED_CODE_PATCHES_COUNT_THRESHOLD = 0
+    similar_pathes_detail_list = check_code_similarity(student_hw_path)
+    duplicated_lines = 0
+
+    if len(similar_pathes_detail_list) >= DUPLICATED_CODE_PATCHES_COUNT_THRESHOLD:
+        human_readable_summaries = []
+        for duplicated_patch in similar_pathes_detail_list:
+            human_readable_summaries.append(["%s:%s %s%s;" % (duplicated_patch.file1,
+                "%d-%d" % duplicated_patch.lines1,
+                duplicated_patch.file2 + ":" if duplicated_patch.file1 != duplicated_patch.file2 else "",
+                "%d-%d" % duplicated_patch.lines2)])
+
+            duplicated_lines += min(interval_size(duplicated_patch.lines1),
+                                            interval_size(duplicated_patch.lines2))
+
+        occurences_txt = absolute_subsampling(human_readable_summaries, 5)
+        rule = rubric["rules"]["duplication"]
+        penalty = rule_penalty(rule, duplicated_lines)
+        duplicated_lines = (duplicated_lines // 20 + 1) * 20
+        line = "-%.1lf: %s (~%d linii) e.g:%s\n" % (penalty, rule.message, duplicated_lines, occurences_txt)
+        grade_file.add_record(line, "duplication", -penalty, duplicated_lines,
+                              [example.strip() for example in occurences_txt.split(";") if example.strip()])
+
+        if verbose:
+            print("<duplicated loc:%6d>\t" % (duplicated_lines), end="")
+
+def assess_manual_only_checkables(grade_file, student_hw_path, verbose = True):
+    grade_file.write("\n")
+    for (check, manually_checked_error) in rubric["manual_checks"]:
+        if grade_file.naming_checked and check in rubric["naming_manual_checks"]:
+            continue
+        grade_file.add_manual_check(manually_checked_error)
+
+CLANG_AST_FLAGS = ["-Xclang", "-ast-dump=json", "-fsyntax-only"]
+AST_VARIABLE_KINDS = ["VarDecl", "ParmVarDecl", "FieldDecl"]
+
+def fill_ast_locations(node, last_location):
+    # clang only prints a location's file/line when they differ from the previously printed
+    # location, walking the nodes in print order restores them on every location.
+    if isinstance(node, dict):
+        if "offset" in node:
+            for key in ["file", "line"]:
+                if key in node:
+                    last_location[key] = node[key]
+                else:
+                    node[key] = last_location.get(key)
+        for value in node.values():
+            fill_ast_locations(value, last_location)
+    elif isinstance(node, list):
+        for value in node:
+            fill_ast_locations(value, last_location)
+
+def ast_line(location):
+    return location.get("expansionLoc", location).get("line")
+
+def collect_ast_details(node, files_absolute_path, functions, variables):
+    if node.get("isImplicit"):
+        return
+    kind = node.get("kind")
+    if kind == "FunctionDecl" and any(child.get("kind") == "CompoundStmt" for child in node.get("inner", [])):
+        start, end = ast_line(node["range"]["begin"]), ast_line(node["range"]["end"])
+        functions.append(FunctionDetails(files_absolute_path, start, end - start, node["name"],
+                                         node["type"]["qualType"]))
+    elif kind in AST_VARIABLE_KINDS and "name" in node:
+        variables.append(VariableDetails(files_absolute_path, ast_line(node["loc"]), node["name"],
+                                         node["type"]["qualType"]))
+    for child in node.get("inner", []):
+        collect_ast_details(child, files_absolute_path, functions, variables)
+
+# source path -> (functions, variables), filled by the cohort prefetch
+ast_results = {}
+
+def clang_command(files_absolute_path):
+    return ["clang"] + CLANG_AST_FLAGS + [files_absolute_path]
+
+def clang_cache_paths(source_file_path):
+    # the dump also depends on every header the source may include from its own archive
+    headers = [path for path in archive_inventory(os.path.dirname(source_file_path)).sources
+               if path.endswith(".h") and path != source_file_path]
+    return [source_file_path] + headers
+
+def ast_dump_parser(files_absolute_path):
+    # -> (feed, functions, variables): feed takes clang's json dump line by line. Every top
+    # level declaration coming from an included (system) header is dropped before being decoded.
+    functions, variables = [], []
+    last_location = {}
+    state = {"declaration" : None, "skipping" : False}
+
+    def feed(output_line):
+        output_line = output_line.decode("utf-8", errors="replace")
+        declaration = state["declaration"]
+        if output_line.startswith("    {"):
+            state.update(declaration = [output_line], skipping = False)
+        elif declaration is None:
+            return
+        elif output_line.rstrip().rstrip(",") == "    }":
+            if not state["skipping"]:
+                declaration.append("    }")
+                node = json.loads("".join(declaration))
+                fill_ast_locations(node, last_location)
+                collect_ast_details(node, files_absolute_path, functions, variables)
+            state["declaration"] = None
+        elif not state["skipping"]:
+            declaration.append(output_line)
+            # the declaration location comes before its range: decide as soon as it is known
+            if output_line.startswith('      "range"') or output_line.startswith('      "loc": {}'):
+                head = "".join(declaration)
+                state["skipping"] = '"includedFrom"' in head or '"loc": {}' in head
+                if state["skipping"]:
+                    del declaration[1:]
+
+    return feed, functions, variables
+
+def run_ast_generation(files_absolute_path):
+    # One clang run per translation unit, its dump is parsed while it is produced.
+    feed, functions, variables = ast_dump_parser(files_absolute_path)
+    try:
+        run_tool("clang", clang_command(files_absolute_path), feed)
+    except OSError:
+        pass
+    return functions, variables
+
+def extract_archive_ast(student_files_path):
+    functions, variables = [], []
+    for source_file_path in archive_inventory(student_files_path).sources:
+        if ("clang", source_file_path) in tool_failures:
+            raise ToolFailure(tool_failures[("clang", source_file_path)])
+        details = ast_results.get(source_file_path)
+        if details is None:
+            details = cached_tool_result("clang", CLANG_AST_FLAGS, clang_cache_paths(source_file_path),
+                                         lambda: run_ast_generation(source_file_path))
+        file_functions, file_variables = details
+        functions += [FunctionDetails(*details) for details in file_functions]
+        variables += [VariableDetails(*details) for details in file_variables]
+    return functions, variables
+
+def is_inadequate_name(name):
+    if len(name) == 1:
+        return name not in rubric["allowed_short_names"]
+    return name.lower() in rubric["meaningless_names"] or meaningless_name_regex.match(name) is not None
+
+def naming_convention(name):
+    if snake_case_regex.match(name):
+        return "snake_case"
+    if camel_case_regex.match(name):
+        return "camelCase"
+    return None
+
+def asses_vars_and_funcs_namings(grade_file, student_hw_path, verbose = True):
+    functions, variables = extract_archive_ast(student_hw_path + "/current/git/archive/")
+    if not functions:
+        # clang missing or the sources do not parse: assess_manual_only_checkables leaves these
+        # checks to the TA, in the manual section that --incremental keeps
+        if verbose:
+            print("<namings: manual>\t", end="")
+        return
+
+    long_functions = [("%s:%d:%s()" % (function.file.split("/")[-1], function.line, function.name),)
+                      for function in functions if function.length > rubric["function_max_length"]]
+    if long_functions:
+        rule = rubric["rules"]["long_functions"]
+        penalty = rule_penalty(rule, len(long_functions))
+        examples = absolute_subsampling(long_functions, 3)
+        line = "-%.1f: %s (peste %d linii) X %d e.g. %s\n" % (penalty, rule.message,
+            rubric["function_max_length"], len(long_functions), examples)
+        grade_file.add_record(line, "long_functions", -penalty, len(long_functions), examples.split())
+
+    bad_names = {}
+    for details in functions + variables:
+        if is_inadequate_name(details.name):
+            bad_names.setdefault((details.file, details.name),
+                                 ("%s:%d:%s" % (details.file.split("/")[-1], details.line, details.name),))
+    if bad_names:
+        rule = rubric["rules"]["bad_names"]
+        penalty = rule_penalty(rule, len(bad_names))
+        examples = absolute_subsampling(list(bad_names.values()), 3)
+        line = "-%.1f: %s X %d e.g. %s\n" % (penalty, rule.message, len(bad_names), examples)
+        grade_file.add_record(line, "bad_names", -penalty, len(bad_names), examples.split())
+
+    conventions = defaultdict(set)
+    for details in functions + variables:
+        convention = naming_convention(details.name)
+        if convention is not None:
+            conventions[convention].add(details.name)
+    if len(conventions) > 1:
+        rule = rubric["rules"]["mixed_naming"]
+        mixed_names = len(conventions["camelCase"]) + len(conventions["snake_case"])
+        penalty = rule_penalty(rule, mixed_names)
+        line = "-%.1f: %s (camelCase X %d, snake_case X %d) e.g. %s %s\n" % (
+            penalty, rule.message, len(conventions["camelCase"]), len(conventions["snake_case"]),
+            min(conventions["camelCase"]), min(conventions["snake_case"]))
+        grade_file.add_record(line, "mixed_naming", -penalty, mixed_names,
+                              [min(conventions["camelCase"]), min(conventions["snake_case"])])
+
+    grade_file.naming_checked = True
+    if verbose:
+        print("<long functions: %d bad names: %d>\t" % (len(long_functions), len(bad_names)), end="")
+
+grading_stages = [
+    assess_leaks_failed_tests,
+    assess_coding_style,
+    asses_vars_and_funcs_namings,
+    asses_duplication,
+    assess_compile_warnings,
+    assess_readme,
+    asses_arh_content,
+    assess_manual_only_checkables,
+]
+
+async def prefetch_external_tools(stud_paths, concurrency = None):
+    # Starts every external tool run of the cohort at once, at most a CPU count of them running
+    # at the same time; the results land in the in-memory tables read by the assessment stages.
+    import asyncio
+    semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+    owners = {}
+
+    async def lint(batch, cache_keys):
+        feed, findings = checkpatch_output_parser(batch)
+        try:
+            await run_tool_async(semaphore, "checkpatch", [CHECKPATCH_WRAPPER] + batch, feed,
+                                 assess_coding_style.__name__, [owners[path] for path in batch])
+        except (ToolFailure, OSError):
+            return # left to each student's own style stage, so one slow file only stalls its owner
+        store_checkpatch_findings(findings, cache_keys)
+
+    async def find_similarities(stud_path):
+        try:
+            archive_files = archive_inventory(stud_path + "/current/git/archive").files
+        except OSError:
+            return
+        key, summaries = cache_lookup("sim_c", SIM_C_FLAGS, archive_files)
+        if summaries is None:
+            try:
+                output, exit_code = await run_tool_async(semaphore, "sim_c", similarity_command(stud_path), None,
+                                                         asses_duplication.__name__, [owners[stud_path]])
+            except ToolFailure as failure:
+                tool_failures[("sim_c", stud_path)] = str(failure)
+                return
+            except OSError:
+                return
+            summaries = parse_similarity_output(output)
+            if key is not None:
+                cache_store(key, summaries)
+        similarity_results[stud_path] = summaries
+
+    async def dump_ast(source_file_path):
+        key, details = cache_lookup("clang", CLANG_AST_FLAGS, clang_cache_paths(source_file_path))
+        if details is None:
+            feed, functions, variables = ast_dump_parser(source_file_path)
+            try:
+                await run_tool_async(semaphore, "clang", clang_command(source_file_path), feed,
+                                     asses_vars_and_funcs_namings.__name__, [owners[source_file_path]])
+            except ToolFailure as failure:
+                tool_failures[("clang", source_file_path)] = str(failure)
+                return
+            except OSError:
+                return
+            details = (functions, variables)
+            if key is not None:
+                cache_store(key, details)
+        ast_results[source_file_path] = details
+
+    def archive_sources(stud_path):
+        # a student whose archive cannot be listed is skipped here, its own stages report it
+        try:
+            sources = archive_inventory(stud_path + "/current/git/archive").sources
+        except OSError:
+            return []
+        owners.update((source_file_path, owners[stud_path]) for source_file_path in sources)
+        return sources
+
+    for stud_path in stud_paths:
+        owners[stud_path] = stud_path.split("/")[-1]
+
+    tasks = []
+    if assess_coding_style in grading_stages and grader_options["style_engine"] == "checkpatch":
+        cohort_sources = []
+        for stud_path in stud_paths:
+            cohort_sources += archive_sources(stud_path)
+        pending, cache_keys = checkpatch_pending(cohort_sources)
+        tasks += [lint(batch, cache_keys) for batch in checkpatch_batches(pending)]
+    if asses_duplication in grading_stages and grader_options["duplication_engine"] == "sim_c":
+        tasks += [find_similarities(stud_path) for stud_path in stud_paths]
+    if asses_vars_and_funcs_namings in grading_stages:
+        for stud_path in stud_paths:
+            tasks += [dump_ast(source_file_path) for source_file_path in archive_sources(stud_path)]
+    await asyncio.gather(*tasks)
+
+GradeJob = namedtuple('GradeJob', 'idx stud_path ta grade_folder verbose unchanged keep_annotations')
+
+MANIFEST_FILE = ".manifest.json"
+
+def rubric_fingerprint():
+    # tool results are cached by their inputs only, so after a rubric edit the regrade of every
+    # student only re-evaluates the rules over the cached findings
+    fingerprinted = [rubric["spec"], [assess.__name__ for assess in grading_stages], grader_options]
+    return hashlib.sha256(json.dumps(fingerprinted, sort_keys=True).encode()).hexdigest()
+
+def student_fingerprint(student_hw_path, ta, rubric_hash):
+    # Everything a grade file depends on: archive contents, test results and the rubric.
+    fingerprint = hashlib.sha256(("%s\0%s\0" % (rubric_hash, ta)).encode())
+    archive_path = student_hw_path + "/current/git/archive"
+    for path in list_files_recursive(archive_path):
+        fingerprint.update(os.path.relpath(path, archive_path).encode(errors="replace") + b"\0")
+        try:
+            with open(path, "rb") as file:
+                fingerprint.update(hashlib.sha256(file.read()).digest())
+        except OSError:
+            # a broken symlink or an unreadable file, the grading stages report it
+            fingerprint.update(b"unreadable")
+    results_path = student_hw_path + "/current/results"
+    if os.path.isdir(results_path):
+        for path in list_files(results_path):
+            if path.endswith(".vmr"):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    fingerprint.update(("%s unreadable\0" % path.split("/")[-1]).encode(errors="replace"))
+                    continue
+                fingerprint.update(("%s %d %d\0" % (path.split("/")[-1], stat.st_mtime_ns,
+                                                    stat.st_size)).encode(errors="replace"))
+    return fingerprint.hexdigest()
+
+def load_manifest(grade_folder):
+    try:
+        with open(grade_folder + "/" + MANIFEST_FILE, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(grade_folder, manifest):
+    tmp_path = grade_folder + "/" + MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, grade_folder + "/" + MANIFEST_FILE)
+
+def manual_section(grade_lines):
+    # the lines written by assess_manual_only_checkables: after the blank line, before the TA line
+    if "\n" not in grade_lines[:-1]:
+        return None
+    start = grade_lines.index("\n")
+    return start, len(grade_lines) - 1
+
+def manual_check_of(grade_line):
+    # -> the rubric manual check a (possibly TA edited) line answers, matched on its message
+    message = grade_line.split(": ", 1)[-1]
+    matches = [(len(text), check) for (check, text) in
+               ((check, text.split(": ", 1)[-1]) for (check, text) in rubric["manual_checks"])
+               if message.startswith(text)]
+    return max(matches)[1] if matches else None
+
+def keep_manual_annotations(old_grade, new_grade):
+    # TAs annotate the MANUAL_TAG lines by hand, a regrade must not bring the defaults back. The
+    # sections are merged per check: checks of the new run keep their old annotated line, checks
+    # that are no longer manual (the naming ones, once an AST is available) are dropped and the
+    # TA's own lines, answering no check, are kept after them.
+    old_lines, new_lines = old_grade.splitlines(True), new_grade.splitlines(True)
+    old_section, new_section = manual_section(old_lines), manual_section(new_lines)
+    if old_section is None or new_section is None:
+        return new_grade
+    annotated, notes = {}, []
+    for line in old_lines[old_section[0] + 1:old_section[1]]:
+        check = manual_check_of(line)
+        if check is None:
+            notes.append(line)
+        else:
+            annotated.setdefault(check, line)
+    merged = [annotated.get(manual_check_of(line), line)
+              for line in new_lines[new_section[0] + 1:new_section[1]]]
+    return "".join(new_lines[:new_section[0] + 1] + merged + notes + new_lines[new_section[1]:])
+
+def process_student(student_hw_path, ta, grade_folder, verbose = True, keep_annotations = False,
+                    grade_file = None):
+    student_id = student_hw_path.split("/")[-1]
+    print(ta, ":\t", student_id + " " * (35 - len(student_hw_path)), end="\t")
+
+    if grade_file is None:
+        grade_file = GradeSheet()
+    try:
+        for assess in grading_stages:
+            with profiled_stage(student_id, assess.__name__):
+                try:
+                    assess(grade_file, student_hw_path, verbose)
+                except ToolFailure as failure:
+                    grade_file.add_todo("[TODO check manually] %s\n" % (failure), str(failure))
+    except UnicodeDecodeError:
+        grade_file.add_todo("[TODO check manually]\n", "UnicodeDecodeError");
+    grade_file.write("%s\n" % (ta))
+
+    grade = grade_file.getvalue()
+    grade_path = grade_folder + "/" + student_id
+    if keep_annotations and os.path.isfile(grade_path):
+        with open(grade_path, "r") as old_grade_file:
+            grade = keep_manual_annotations(old_grade_file.read(), grade)
+    with open(grade_path, "w") as output_file:
+        output_file.write(grade)
+
+    print("")
+    return grade_file.student_record(student_id, ta)
+
+def grade_student_job(job):
+    # Runs in a worker process: the console output is captured and handed back to the
+    # parent so it is printed in submission order, never interleaved with other students.
+    console = io.StringIO()
+    error = None
+    student_id = job.stud_path.split("/")[-1]
+    del profile_records[:]
+    if job.unchanged:
+        return job, "%s :\t %s <unchanged>\n" % (job.ta, student_id), error, [], None
+    grade_file = GradeSheet()
+    with contextlib.redirect_stdout(console):
+        try:
+            record = process_student(job.stud_path, job.ta, job.grade_folder, job.verbose, job.keep_annotations,
+                                     grade_file)
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+    if error is not None:
+        # a crashed student gets flagged for the TA instead of aborting the whole run; the grade
+        # file is replaced by what the stages graded so far, never appended to a previous run's
+        grade_file.add_todo("[TODO check manually] grader crashed (%s)\n" % (error), "grader crashed (%s)" % (error))
+        with open(job.grade_folder + "/" + student_id, "w") as output_file:
+            output_file.write(grade_file.getvalue() + "%s\n" % (job.ta))
+        record = grade_file.student_record(student_id, job.ta)
+        record["total"] = None
+    return job, console.getvalue(), error, list(profile_records), record
+
+def load_grade_records(path):
+    records = {}
+    if os.path.isfile(path):
+        with open(path, "r") as file:
+            for line in file:
+                record = json.loads(line)
+                records[record["student"]] = record
+    return records
+
+def write_grade_records_sqlite(path, student_records, keep_previous):
+    import sqlite3
+    connection = sqlite3.connect(path)
+    try:
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS students (student TEXT PRIMARY KEY, ta TEXT, "
+                               "total REAL, todo TEXT, manual_checks TEXT)")
+            connection.execute("CREATE TABLE IF NOT EXISTS records (student TEXT, category TEXT, "
+                               "penalty REAL, count INTEGER, examples TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS records_student ON records (student)")
+            if keep_previous:
+                students = [(record["student"],) for record in student_records]
+                connection.executemany("DELETE FROM students WHERE student = ?", students)
+                connection.executemany("DELETE FROM records WHERE student = ?", students)
+            else:
+                connection.execute("DELETE FROM students")
+                connection.execute("DELETE FROM records")
+            connection.executemany("INSERT INTO students VALUES (?, ?, ?, ?, ?)",
+                [(record["student"], record["ta"], record["total"], json.dumps(record["todo"]),
+                  json.dumps(record["manual_checks"])) for record in student_records])
+            connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?)",
+                [(record["student"], grade_record["category"], grade_record["penalty"],
+                  grade_record["count"], json.dumps(grade_record["examples"]))
+                 for record in student_records for grade_record in record["records"]])
+    finally:
+        connection.close()
+
+def write_grade_records(path, student_records, keep_previous = False):
+    # One file for the whole cohort, written in bulk once grading is done: JSON Lines (one
+    # student per line) or, for .sqlite/.db, a students & records table pair. With keep_previous
+    # (--incremental) the students that were not regraded keep their previous entries.
+    if path.endswith((".sqlite", ".db")):
+        write_grade_records_sqlite(path, student_records, keep_previous)
+        return
+
+    records = load_grade_records(path) if keep_previous else {}
+    for record in student_records:
+        records[record["student"]] = record
+    lines = [json.dumps(records[student], ensure_ascii=False, separators=(",", ":")) + "\n"
+             for student in sorted(records)]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.writelines(lines)
+    os.replace(tmp_path, path)
+
+def assign_teaching_assistants(args, to_skip_messages):
+    # -> [(idx, student path, ta)]; the TA of every student only depends on its position in the
+    # sorted assignments directory
+    assigned = []
+    for (idx, stud_path) in enumerate(list_dirs(args.assignments_path)):
+        ta = args.teaching_assistants[idx % len(args.teaching_assistants)]
+
+        if skip_students(stud_path):
+            line = ta + " skipping " + stud_path + "-> check manually!"
+            to_skip_messages.append(line)
+            continue
+        elif ignore_students(stud_path):
+            continue
+        assigned.append((idx, stud_path, ta))
+    return assigned
+
+def grading_list(args):
+    to_skip_messages = []
+    to_grade = {ta : [] for ta in args.teaching_assistants}
+    for (idx, stud_path, ta) in assign_teaching_assistants(args, to_skip_messages):
+        to_grade[ta].append(stud_path.split("/")[-1])
+
+    for (ta, students) in to_grade.items():
+        with open("to_grade." + ta, "w") as to_grade_file:
+            to_grade_file.writelines(student_id + "\n" for student_id in students)
+        print("%s : %d students -> to_grade.%s" % (ta, len(students), ta))
+    for skip_message in to_skip_messages:
+        print(skip_message)
+
+def grade_jobs(args):
+    # -> (jobs, skip messages, manifest, fingerprints)
+    to_skip_messages = []
+    jobs = []
+
+    manifest = load_manifest(args.grade) if args.incremental else {}
+    fingerprints = {}
+    rubric_hash = rubric_fingerprint()
+
+    for (idx, stud_path, ta) in assign_teaching_assistants(args, to_skip_messages):
+        unchanged, keep_annotations = False, False
+        if args.incremental:
+            student_id = stud_path.split("/")[-1]
+            fingerprints[student_id] = student_fingerprint(stud_path, ta, rubric_hash)
+            grade_exists = os.path.isfile(args.grade + "/" + student_id)
+            unchanged = grade_exists and manifest.get(student_id) == fingerprints[student_id]
+            keep_annotations = grade_exists
+
+        jobs.append(GradeJob(idx, stud_path, ta, args.grade, args.verbose, unchanged, keep_annotations))
+
+    return jobs, to_skip_messages, manifest, fingerprints
+
+def merge_grade_results(args, results, manifest, fingerprints, cohort_profile, to_skip_messages):
+    # results are (job, console, error, profile, record) in job order, so to_grade.<ta> lists are
+    # the same for any --jobs and any number of distributed workers
+    to_grade_list = {}
+    for ta in args.teaching_assistants:
+        to_grade_list[ta] = open("to_grade." + ta, "w")
+
+    student_records = []
+    for (job, console, error, student_profile, record) in results:
+        print(console, end="")
+        cohort_profile += student_profile
+        if record is not None:
+            student_records.append(record)
+        student_id = job.stud_path.split("/")[-1]
+        if error is not None:
+            print(job.ta, "crashed on", job.stud_path, "->", error, "-> check manually!")
+            manifest.pop(student_id, None)
+        elif args.incremental:
+            manifest[student_id] = fingerprints[student_id]
+        to_grade_list[job.ta].write(student_id + "\n")
+
+        if job.idx % args.print_delim_every == 0:
+            print("-" * 200)
+
+    for to_grade_file in to_grade_list.values():
+        to_grade_file.close()
+
+    if args.incremental:
+        save_manifest(args.grade, manifest)
+
+    if args.grade_records is not None:
+        write_grade_records(args.grade_records, student_records, keep_previous = args.incremental)
+
+    if args.profile is not None:
+        write_profile(args.profile, cohort_profile)
+
+    trim_cache()
+
+    for skip_message in to_skip_messages:
+        print(skip_message)
+
+def prefetch_and_grade(chunk):
+    # -> (job results, prefetch profile); runs in a pool worker, which starts and parses the
+    # external tool runs of its own chunk of students
+    import asyncio
+    chunk_jobs, concurrency = chunk
+    del profile_records[:]
+    with profiled_stage("<chunk>", "prefetch_external_tools"):
+        asyncio.run(prefetch_external_tools([job.stud_path for job in chunk_jobs if not job.unchanged],
+                                            concurrency))
+    chunk_profile = list(profile_records)
+    return [grade_student_job(job) for job in chunk_jobs], chunk_profile
+
+def pooled_grade_results(jobs, jobs_count, chunk_size, cohort_profile):
+    # -> the job results, in job order; the chunks' prefetch profiles are added to cohort_profile
+    import multiprocessing
+    concurrency = max(1, (os.cpu_count() or 1) // jobs_count)
+    chunks = [(jobs[i:i + chunk_size], concurrency) for i in range(0, len(jobs), chunk_size)]
+    with multiprocessing.Pool(jobs_count) as pool:
+        for (job_results, chunk_profile) in pool.imap(prefetch_and_grade, chunks):
+            cohort_profile.extend(chunk_profile)
+            yield from job_results
+
+def grade(args):
+    import asyncio
+    jobs, to_skip_messages, manifest, fingerprints = grade_jobs(args)
+
+    if args.jobs > 1:
+        # every worker prefetches a --unit_size chunk of students, so parsing the tools' output
+        # is spread over the --jobs processes too
+        cohort_profile = []
+        merge_grade_results(args, pooled_grade_results(jobs, args.jobs, args.unit_size, cohort_profile),
+                            manifest, fingerprints, cohort_profile, to_skip_messages)
+        return
+
+    # run the cohort's external tools up front, concurrently
+    with profiled_stage("<cohort>", "prefetch_external_tools"):
+        asyncio.run(prefetch_external_tools([job.stud_path for job in jobs if not job.unchanged]))
+    cohort_profile = list(profile_records)
+    merge_grade_results(args, map(grade_student_job, jobs), manifest, fingerprints,
+                        cohort_profile, to_skip_messages)
+
+# Distributed grading: the coordinator plans the jobs exactly like grade(), hands the students
+# out in units over a multiprocessing connection and writes every grade file itself; workers
+# (any host seeing the same assignments path) grade a unit in a scratch folder and send back
+# the grade texts & records. The connection carries pickles: --authkey must be kept secret and
+# the port must only be reachable from the grading hosts.
+GRADER_UNIT_SIZE = 8
+
+def distributed_authkey(args):
+    # there is no default secret; only a coordinator whose workers are all spawned by itself may
+    # go without one, they get a random key through the environment
+    if args.authkey is not None:
+        return args.authkey
+    if args.coordinator is not None and args.spawn_workers > 0:
+        import secrets
+        return secrets.token_hex(32)
+    sys.exit("%s: --coordinator and --worker need --authkey or $GRADER_AUTHKEY"
+             % (os.path.basename(sys.argv[0])))
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+def reset_cohort_state():
+    # a long lived worker must not carry one unit's tool results or inventories into the next
+    for results in [checkpatch_results, ast_results, similarity_results, tool_failures, archive_inventories]:
+        results.clear()
+
+def crashed_job_result(job, error):
+    student_id = job.stud_path.split("/")[-1]
+    record = {"student" : student_id, "ta" : job.ta, "total" : None, "records" : [],
+              "todo" : ["grader crashed (%s)" % (error)], "manual_checks" : []}
+    grade_text = "[TODO check manually] grader crashed (%s)\n%s\n" % (error, job.ta)
+    return (job, "", error, [], record), grade_text
+
+def grade_unit(unit, scratch_folder, jobs_count):
+    # -> ([((job, console, error, profile, record), grade text)], prefetch profile)
+    import asyncio
+    local_jobs = []
+    for (job, old_grade) in unit:
+        if old_grade is not None:
+            with open(scratch_folder + "/" + job.stud_path.split("/")[-1], "w") as old_grade_file:
+                old_grade_file.write(old_grade)
+        local_jobs.append(job._replace(grade_folder = scratch_folder))
+
+    if jobs_count > 1:
+        unit_profile = []
+        chunk_size = -(-len(local_jobs) // jobs_count)
+        job_results = list(pooled_grade_results(local_jobs, jobs_count, chunk_size, unit_profile))
+    else:
+        del profile_records[:]
+        with profiled_stage("<unit>", "prefetch_external_tools"):
+            asyncio.run(prefetch_external_tools([job.stud_path for job in local_jobs]))
+        unit_profile = list(profile_records)
+        job_results = list(map(grade_student_job, local_jobs))
+
+    results = []
+    for ((job, old_grade), job_result) in zip(unit, job_results):
+        grade_path = scratch_folder + "/" + job.stud_path.split("/")[-1]
+        with open(grade_path, "r") as grade_file:
+            grade_text = grade_file.read()
+        os.remove(grade_path)
+        results.append(((job,) + job_result[1:], grade_text))
+    return results, unit_profile
+
+def worker(args):
+    import multiprocessing.connection
+    import tempfile
+    address = parse_address(args.worker)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            connection = multiprocessing.connection.Client(address, authkey = args.authkey.encode())
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+    scratch_folder = tempfile.mkdtemp(prefix = "grader-worker-")
+    try:
+        with connection:
+            options, cache_options, rubric_spec = connection.recv()
+            grader_options.update(options)
+            apply_rubric(rubric_spec)
+            result_cache.update(cache_options)
+            while True:
+                message = connection.recv()
+                if message[0] == "stop":
+                    break
+                unit_id, unit = message[1], message[2]
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        connection.send(("result", unit_id) + grade_unit(unit, scratch_folder, args.jobs))
+                except Exception as e:
+                    connection.send(("failed", unit_id, "%s: %s" % (type(e).__name__, e)))
+                reset_cohort_state()
+    finally:
+        shutil.rmtree(scratch_folder, ignore_errors = True)
+
+def coordinate(args):
+    import multiprocessing.connection
+    jobs, to_skip_messages, manifest, fingerprints = grade_jobs(args)
+    results = {job.idx : (grade_student_job(job), None) for job in jobs if job.unchanged}
+
+    units = {}
+    pending = []
+    for job in jobs:
+        if job.unchanged:
+            continue
+        old_grade = None
+        if job.keep_annotations:
+            with open(args.grade + "/" + job.stud_path.split("/")[-1], "r") as old_grade_file:
+                old_grade = old_grade_file.read()
+        if not pending or len(units[pending[-1]]) == args.unit_size:
+            pending.append(len(units))
+            units[pending[-1]] = []
+        units[pending[-1]].append((job, old_grade))
+
+    attempts = Counter()
+    cohort_profile = []
+    state = threading.Condition()
+    remaining = [len(units)]
+    connected = [0]
+
+    def finish_unit(unit_id, unit_results, unit_profile):
+        for (job_result, grade_text) in unit_results:
+            results[job_result[0].idx] = (job_result, grade_text)
+        cohort_profile.extend(unit_profile)
+        remaining[0] -= 1
+        state.notify_all()
+
+    def unit_failed(unit_id, error):
+        attempts[unit_id] += 1
+        print("unit %d failed (attempt %d): %s" % (unit_id, attempts[unit_id], error))
+        if attempts[unit_id] <= args.retries:
+            pending.append(unit_id)
+            state.notify_all()
+            return
+        finish_unit(unit_id, [crashed_job_result(job, "unit failed: %s" % (error))
+                              for (job, old_grade) in units[unit_id]], [])
+
+    def close_out_pending(error):
+        while pending:
+            unit_id = pending.pop(0)
+            finish_unit(unit_id, [crashed_job_result(job, error) for (job, old_grade) in units[unit_id]], [])
+
+    def serve(connection):
+        with state:
+            connected[0] += 1
+        try:
+            serve_worker(connection)
+        finally:
+            with state:
+                connected[0] -= 1
+                state.notify_all()
+
+    def serve_worker(connection):
+        with connection:
+            try:
+                connection.send((grader_options, result_cache, rubric["spec"]))
+            except OSError:
+                return
+            while True:
+                with state:
+                    while not pending and remaining[0] > 0:
+                        state.wait()
+                    if not pending:
+                        break
+                    unit_id = pending.pop(0)
+                try:
+                    connection.send(("unit", unit_id, units[unit_id]))
+                    if not connection.poll(args.unit_timeout):
+                        raise TimeoutError("no result after %ds" % (args.unit_timeout))
+                    reply = connection.recv()
+                except (OSError, EOFError) as e:
+                    with state:
+                        unit_failed(unit_id, "worker lost (%s)" % (type(e).__name__))
+                    return
+                with state:
+                    if reply[0] == "result":
+                        finish_unit(unit_id, reply[2], reply[3])
+                    else:
+                        unit_failed(unit_id, reply[2])
+            try:
+                connection.send(("stop",))
+            except OSError:
+                pass
+
+    listener = multiprocessing.connection.Listener(parse_address(args.coordinator),
+                                                   authkey = args.authkey.encode())
+    def accept():
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, multiprocessing.AuthenticationError):
+                if remaining[0] == 0:
+                    return # the listener was closed
+                continue
+            threading.Thread(target = serve, args = (connection,), daemon = True).start()
+    threading.Thread(target = accept, daemon = True).start()
+
+    host, port = listener.address
+    print("Coordinating %d units on %s:%d" % (len(units), host, port))
+    entry_point = os.path.join(os.path.dirname(os.path.abspath(__file__)), "automatic-grader.py")
+    # the key goes through the environment, command lines are visible to every local user
+    spawned = [Popen([sys.executable, entry_point, "--worker", "%s:%d" % (host, port), "--jobs", str(args.jobs)],
+                     env = dict(os.environ, GRADER_AUTHKEY = args.authkey))
+               for i in range(args.spawn_workers)]
+
+    # Units are only lost with their worker: once no worker is connected and none of the spawned
+    # ones is still starting, the pending units wait --worker_timeout for a worker to show up and
+    # are closed out as crashed, so the merge still runs.
+    idle_since = None
+    with state:
+        while remaining[0] > 0:
+            if connected[0] > 0 or any(process.poll() is None for process in spawned):
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > args.worker_timeout:
+                print("no worker left after %ds, %d units are not graded" % (args.worker_timeout, len(pending)))
+                close_out_pending("no worker left to grade it")
+                continue
+            state.wait(1)
+    listener.close()
+    for process in spawned:
+        process.wait()
+
+    for (job_result, grade_text) in results.values():
+        if grade_text is not None:
+            with open(args.grade + "/" + job_result[0].stud_path.split("/")[-1], "w") as grade_file:
+                grade_file.write(grade_text)
+    merge_grade_results(args, [results[job.idx][0] for job in jobs], manifest, fingerprints,
+                        cohort_profile, to_skip_messages)
+
+PLAGIARISM_KGRAM = 20
+PLAGIARISM_WINDOW = 10
+PLAGIARISM_MAX_POSTING_RATIO = 0.1
+
+def source_fingerprints(source_file_path):
+    tokens = tokenize_c_file(source_file_path)
+    return [(fingerprint, tokens[position].line, tokens[position + PLAGIARISM_KGRAM - 1].line)
+            for (fingerprint, position) in winnow(kgram_hashes(tokens, PLAGIARISM_KGRAM),
+                                                  PLAGIARISM_WINDOW)]
+
+def student_fingerprints(stud_path):
+    # file name -> [(fingerprint, first line, last line)]
+    fingerprints = {}
+    for source_file_path in archive_inventory(stud_path + "/current/git/archive").sources:
+        try:
+            fingerprints[source_file_path.split("/")[-1]] = source_fingerprints(source_file_path)
+        except OSError:
+            pass
+    return stud_path, fingerprints
+
+def merge_line_ranges(ranges):
+    merged = []
+    for (start, end) in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def plagiarism(args):
+    import multiprocessing
+    students = [stud_path for stud_path in list_dirs(args.assignments_path)
+                if not skip_students(stud_path) and not ignore_students(stud_path)]
+
+    baseline = set()
+    if args.baseline_path is not None:
+        for source_file_path in list_sources(args.baseline_path):
+            baseline.update(fingerprint for (fingerprint, first, last)
+                            in source_fingerprints(source_file_path))
+
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            cohort = pool.map(student_fingerprints, students)
+    else:
+        cohort = list(map(student_fingerprints, students))
+
+    # inverted index: fingerprint -> [(student idx, file name, first line, last line)]
+    index = defaultdict(list)
+    fingerprints_count = []
+    for (stud_idx, (stud_path, files)) in enumerate(cohort):
+        distinct = set()
+        for (file_name, fingerprints) in files.items():
+            for (fingerprint, first, last) in fingerprints:
+                if fingerprint in baseline:
+                    continue
+                index[fingerprint].append((stud_idx, file_name, first, last))
+                distinct.add(fingerprint)
+        fingerprints_count.append(len(distinct))
+
+    # fingerprints shared by a big part of the cohort are idioms, not copies; dropping them
+    # bounds the pairs generated per fingerprint and keeps the whole pass near-linear
+    max_posting = max(10, int(PLAGIARISM_MAX_POSTING_RATIO * len(cohort)))
+    shared = defaultdict(int)
+    matches = defaultdict(lambda: defaultdict(lambda: ([], [])))
+    for postings in index.values():
+        by_student = defaultdict(list)
+        for (stud_idx, file_name, first, last) in postings:
+            by_student[stud_idx].append((file_name, first, last))
+        if len(by_student) < 2 or len(by_student) > max_posting:
+            continue
+        owners = sorted(by_student)
+        for (i, stud_a) in enumerate(owners):
+            for stud_b in owners[i + 1:]:
+                shared[(stud_a, stud_b)] += 1
+                for (file_a, first_a, last_a) in by_student[stud_a]:
+                    for (file_b, first_b, last_b) in by_student[stud_b]:
+                        ranges_a, ranges_b = matches[(stud_a, stud_b)][(file_a, file_b)]
+                        ranges_a.append((first_a, last_a))
+                        ranges_b.append((first_b, last_b))
+
+    ranking = []
+    for ((stud_a, stud_b), count) in shared.items():
+        similarity = count / max(1, min(fingerprints_count[stud_a], fingerprints_count[stud_b]))
+        if similarity >= args.plagiarism_threshold:
+            ranking.append((similarity, count, stud_a, stud_b))
+    ranking.sort(key=lambda entry: (-entry[0], -entry[1], entry[2], entry[3]))
+
+    with open(args.plagiarism_report, "w") as report:
+        for (similarity, count, stud_a, stud_b) in ranking:
+            name_a, name_b = cohort[stud_a][0].split("/")[-1], cohort[stud_b][0].split("/")[-1]
+            report.write("%3d%% %s %s (%d common fingerprints)\n" % (similarity * 100, name_a, name_b, count))
+            for ((file_a, file_b), (ranges_a, ranges_b)) in sorted(matches[(stud_a, stud_b)].items()):
+                report.write("\t%s:%s ~ %s:%s\n" % (file_a,
+                    ",".join("%d-%d" % tuple(r) for r in merge_line_ranges(ranges_a)), file_b,
+                    ",".join("%d-%d" % tuple(r) for r in merge_line_ranges(ranges_b))))
+
+    print("Compared %d students, %d suspicious pairs -> %s" % (len(cohort), len(ranking),
+                                                               args.plagiarism_report))
+
+STAT_PERCENTILES = [10, 25, 50, 75, 90]
+
+def student_metrics(job):
+    stud_path, with_style = job
+    points, leaks, tests = scan_run_output(stud_path + "/current/results/run-stdout.vmr")
+    style_penalty = float("nan")
+    if with_style:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                style_penalty = assess_coding_style(GradeSheet(), stud_path, verbose = False)
+        except Exception:
+            pass
+    return stud_path, 110 - points, leaks, style_penalty, tests
+
+def collect_cohort_metrics(args):
+    # Per student metrics are gathered once into a columnar table (one numpy array per column),
+    # every statistic after that is computed on whole columns.
+    import multiprocessing
+    import numpy as np
+    stud_paths = list_dirs(args.assignments_path)
+    jobs = [(stud_path, args.stat_style) for stud_path in stud_paths]
+    if args.jobs > 1:
+        with multiprocessing.Pool(args.jobs) as pool:
+            rows = pool.map(student_metrics, jobs)
+    else:
+        rows = list(map(student_metrics, jobs))
+
+    test_names = sorted(set(name for row in rows for name in row[4]))
+    test_columns = {name : idx for (idx, name) in enumerate(test_names)}
+    # 1 passed, 0 failed, -1 test missing from the student's log
+    tests = np.full((len(rows), len(test_names)), -1, dtype=np.int8)
+    for (row_idx, row) in enumerate(rows):
+        for (name, passed) in row[4].items():
+            tests[row_idx, test_columns[name]] = passed
+
+    return {
+        "student" : np.array([row[0].split("/")[-1] for row in rows], dtype=object),
+        "ta" : np.array([args.teaching_assistants[idx % len(args.teaching_assistants)]
+                         for idx in range(len(rows))], dtype=object),
+        "failed" : np.array([row[1] for row in rows], dtype=np.float64),
+        "leaks" : np.array([row[2] for row in rows], dtype=np.int64),
+        "style_penalty" : np.array([row[3] for row in rows], dtype=np.float64),
+        "test_names" : test_names,
+        "tests" : tests,
+    }
+
+def cohort_statistics(table, teaching_assistants):
+    import numpy as np
+    points = 110 - table["failed"]
+    tests = table["tests"]
+    ran = (tests >= 0).sum(axis=0)
+    passed = (tests == 1).sum(axis=0)
+    statistics = {
+        "count" : int(len(points)),
+        "count_perfect" : int((table["failed"] == 0).sum()),
+        "average_points" : float(points.mean()),
+        "average_leaks" : float(table["leaks"].mean()),
+        "test_pass_rate" : dict(zip(table["test_names"],
+                                    (passed / np.maximum(ran, 1)).round(3).tolist())),
+        "leaks_distribution" : np.bincount(table["leaks"]).tolist(),
+        "points_percentiles" : {},
+    }
+
+    style = table["style_penalty"][~np.isnan(table["style_penalty"])]
+    if len(style) > 0:
+        counts, edges = np.histogram(style, bins=np.linspace(0.0, 0.6, 7))
+        statistics["style_penalty_histogram"] = {"%.1f-%.1f" % (edges[i], edges[i + 1]) : int(counts[i])
+                                                 for i in range(len(counts))}
+
+    for ta in teaching_assistants:
+        group = points[table["ta"] == ta]
+        if len(group) > 0:
+            statistics["points_percentiles"][ta] = dict(zip(map(str, STAT_PERCENTILES),
+                np.percentile(group, STAT_PERCENTILES).round(1).tolist()))
+    return statistics
+
+def write_stat_output(path, table, statistics):
+    import numpy as np
+    if path.endswith(".json"):
+        students = [{"student" : table["student"][i], "ta" : table["ta"][i],
+                     "points" : 110 - table["failed"][i], "leaks" : int(table["leaks"][i]),
+                     "style_penalty" : None if np.isnan(table["style_penalty"][i]) else table["style_penalty"][i]}
+                    for i in range(len(table["student"]))]
+        with open(path, "w") as file:
+            json.dump({"statistics" : statistics, "students" : students}, file, indent=1)
+        return
+
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["student", "ta", "points", "leaks", "style_penalty"] + table["test_names"])
+        for i in range(len(table["student"])):
+            writer.writerow([table["student"][i], table["ta"][i], 110 - table["failed"][i],
+                             table["leaks"][i], table["style_penalty"][i]] + table["tests"][i].tolist())
+
+def stat(args):
+    table = collect_cohort_metrics(args)
+    count = len(table["student"])
+    if count == 0:
+        print("No students found in", args.assignments_path)
+        return
+    statistics = cohort_statistics(table, args.teaching_assistants)
+
+    count_perfect = statistics["count_perfect"]
+    percentage = int(count_perfect / count * 100.0)
+    print("Complete Hw Percentage = ", count_perfect, "/", count, " -> %d%%" % (percentage))
+    print("Average grade : %3.1lf" % (statistics["average_points"]))
+    print("Average amount of leaks : %3.1lf" % (statistics["average_leaks"]))
+
+    if args.verbose:
+        for (test_name, pass_rate) in statistics["test_pass_rate"].items():
+            print("Test %-40s passed by %3d%%" % (test_name, pass_rate * 100))
+        print("Leaks distribution (students with 0, 1, 2.. leaks) :", statistics["leaks_distribution"])
+        for (penalty_range, students) in statistics.get("style_penalty_histogram", {}).items():
+            print("Style penalty %s : %d" % (penalty_range, students))
+        for (ta, percentiles) in statistics["points_percentiles"].items():
+            print("%s points percentiles %s" % (ta, percentiles))
+
+    if args.stat_output is not None:
+        write_stat_output(args.stat_output, table, statistics)
+
+def add_cohort_arguments(parser):
+    parser.add_argument('--assignments_path', metavar='input', type=str,
+                        default="hws/1-list/",
+                        help='A path towards the homeworks of the students.')
+    parser.add_argument("--teaching_assistants", nargs="+", default=['RAA', 'PR'], metavar='ta',
+                        type=str, help="The teaching assistants responsible for this assignment.")
+    parser.add_argument("--verbose", action='store_true')
+
+def add_tool_arguments(parser):
+    parser.add_argument("--no_cache", "--no-cache", action='store_true',
+                        help="Do not reuse or store external tool results in the on-disk cache.")
+    parser.add_argument("--cache_dir", "--cache-dir", default=result_cache["dir"], metavar='dir',
+                        help="Directory of the external tool results cache.")
+    parser.add_argument("--cache_size", type=int, default=result_cache["max_bytes"] // 2**20,
+                        metavar='MB', help="Size cap of the results cache, oldest entries are evicted.")
+    parser.add_argument("--dup_engine", "--dup-engine", choices=["native", "sim_c"], default="native",
+                        help="Built-in token duplicate finder or the external sim_c tool.")
+    parser.add_argument("--style_engine", "--style-engine", choices=["native", "checkpatch"],
+                        default="checkpatch",
+                        help="Built-in linter for the penalised style rules or the full checkpatch run.")
+    parser.add_argument("--jobs", type=int, default=1, metavar='N',
+                        help="Number of students graded in parallel worker processes.")
+    parser.add_argument("--rubric", default=RUBRIC_FILE, metavar='file',
+                        help="Rubric of penalties & manual checks (JSON); a %s in the assignments path "
+                        "overrides parts of it." % (ASSIGNMENT_RUBRIC_FILE))
+
+def add_grade_arguments(parser):
+    parser.add_argument('--grade', default="grades/", metavar="output_dir",
+                        help="Destination directory for generated grade files.")
+    parser.add_argument("--print_delim_every", type=int, default=5, metavar='inteval')
+    parser.add_argument("--style_conformance", default=None, metavar='file',
+                        help="Diffs the native style findings against checkpatch on all the sources "
+                        "of the assignment; per source differences are written to file.")
+    parser.add_argument("--grade_records", "--grade-records", default=None, metavar='file',
+                        help="Also writes the structured grade records of the whole cohort, as JSON Lines "
+                        "or an SQLite database (.sqlite/.db).")
+    parser.add_argument("--incremental", action='store_true',
+                        help="Only regrade students whose archive, results or the rubric changed "
+                        "since the last --incremental run; TA edits of the manual checks are kept.")
+    parser.add_argument("--profile", default=None, metavar='file',
+                        help="Times every assessment stage and writes per stage totals, p50/p95 and the "
+                        "slowest students (.json) or the per student & stage measurements (.csv).")
+    parser.add_argument("--coordinator", default=None, metavar='host:port',
+                        help="Grades through distributed --worker processes connecting to host:port.")
+    parser.add_argument("--worker", default=None, metavar='host:port',
+                        help="Grades the units handed out by the --coordinator at host:port.")
+    parser.add_argument("--authkey", default=os.environ.get("GRADER_AUTHKEY"),
+                        help="Shared secret of the coordinator and its workers (default $GRADER_AUTHKEY), "
+                        "required unless all the workers are --spawn_workers.")
+    parser.add_argument("--spawn_workers", type=int, default=0, metavar='N',
+                        help="Also starts N local workers for the --coordinator.")
+    parser.add_argument("--unit_size", type=int, default=GRADER_UNIT_SIZE, metavar='students',
+                        help="Students per work unit handed to a worker, or prefetched & graded by one --jobs process.")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="How many times a failed or lost unit is handed out again.")
+    parser.add_argument("--unit_timeout", type=int, default=3600, metavar='seconds',
+                        help="A worker not answering a unit within this time is considered lost.")
+    parser.add_argument("--worker_timeout", type=int, default=60, metavar='seconds',
+                        help="How long the coordinator waits while no worker is connected (or starting) "
+                             "before failing the units left.")
+
+def add_stat_arguments(parser):
+    parser.add_argument("--stat_style", action='store_true',
+                        help="Also collect coding style penalties in --stat (runs checkpatch).")
+    parser.add_argument("--stat_output", default=None, metavar='file',
+                        help="Writes the --stat per student table (.csv) or statistics (.json).")
+
+def existing_directory(path):
+    if not os.path.isdir(path):
+        raise argparse.ArgumentTypeError("%s is not a directory" % (path))
+    return path
+
+def add_plagiarism_arguments(parser):
+    parser.add_argument("--baseline_path", default=None, metavar='dir', type=existing_directory,
+                        help="Starter/skeleton sources whose code is never reported as plagiarism.")
+    parser.add_argument("--plagiarism_threshold", type=float, default=0.3, metavar='ratio',
+                        help="Minimum share of common fingerprints for a reported pair.")
+    parser.add_argument("--plagiarism_report", default="plagiarism.txt", metavar='file',
+                        help="Where the ranked similar pairs are written.")
+
+SUBCOMMANDS = {
+    "grade" : ("Grades every student, one grade.vmr-like file each.",
+               [add_cohort_arguments, add_tool_arguments, add_grade_arguments]),
+    "stat" : ("Computes average points, leaks & per test pass rates of the cohort.",
+              [add_cohort_arguments, add_tool_arguments, add_stat_arguments]),
+    "list" : ("Writes the to_grade.<ta> lists of students each teaching assistant grades.",
+              [add_cohort_arguments]),
+    "plagiarism" : ("Compares the sources of all students and ranks the similar pairs.",
+                    [add_cohort_arguments, add_tool_arguments, add_plagiarism_arguments]),
+}
+
+def legacy_argument_parser():
+    # the flags only interface: every option at the top level, --stat/--plagiarism/
+    # --generate_grading_list pick the command, grading is the default
+    parser = argparse.ArgumentParser(description='Automatic grade of student homeworks. \
+            Generates a file in grade.vmr format for each student found in homeworks path. \
+            Also usable as: %s {%s} [options]' % (os.path.basename(sys.argv[0]), ",".join(SUBCOMMANDS)))
+    for add_arguments in [add_cohort_arguments, add_tool_arguments, add_grade_arguments,
+                          add_stat_arguments, add_plagiarism_arguments]:
+        add_arguments(parser)
+    parser.add_argument("--generate_grading_list", action='store_true',
+                        help='Whether to generate a list of student that should be graded by"\
+                        "each teaching assitant')
+    parser.add_argument("--stat", action='store_true',
+                        help="Computes average points, average leaks..")
+    parser.add_argument("--plagiarism", action='store_true',
+                        help="Compares the sources of all students and ranks the similar pairs.")
+    return parser
+
+def apply_tool_arguments(args):
+    grader_options["duplication_engine"] = args.dup_engine
+    grader_options["style_engine"] = args.style_engine
+    result_cache["enabled"] = not args.no_cache
+    result_cache["dir"] = args.cache_dir
+    result_cache["max_bytes"] = args.cache_size * 2**20
+    apply_rubric(load_rubric(args.rubric, args.assignments_path))
+
+def grade_command(args):
+    if args.worker is not None or args.coordinator is not None:
+        args.authkey = distributed_authkey(args)
+    apply_tool_arguments(args)
+    if args.worker is not None:
+        worker(args)
+    elif args.coordinator is not None:
+        coordinate(args)
+    elif args.style_conformance is not None:
+        style_conformance(args)
+    else:
+        grade(args)
+
+def stat_command(args):
+    apply_tool_arguments(args)
+    stat(args)
+
+def plagiarism_command(args):
+    apply_tool_arguments(args)
+    plagiarism(args)
+
+def main():
+    commands = {"grade" : grade_command, "stat" : stat_command, "list" : grading_list,
+                "plagiarism" : plagiarism_command}
+    argv = sys.argv[1:]
+    if argv and argv[0] in SUBCOMMANDS:
+        command = argv[0]
+        description, argument_groups = SUBCOMMANDS[command]
+        parser = argparse.ArgumentParser(prog = "%s %s" % (os.path.basename(sys.argv[0]), command),
+                                         description = description)
+        for add_arguments in argument_groups:
+            add_arguments(parser)
+        args = parser.parse_args(argv[1:])
+    else:
+        args = legacy_argument_parser().parse_args(argv)
+        command = "grade"
+        if args.generate_grading_list:
+            command = "list"
+        elif args.stat:
+            command = "stat"
+        elif args.plagiarism:
+            command = "plagiarism"
+
+    commands[command](args)
+
+if __name__ == "__main__":
+    main()
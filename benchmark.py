@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+GRADER_DIR = os.path.dirname(os.path.abspath(__file__))
+GRADER_PATH = os.path.join(GRADER_DIR, "automatic-grader.py")
+STARTUP_RUNS = 10
+
+# Stand-ins for the external checkers, installed when the real tool is not in $PATH (or with
+# --stub_tools, so the numbers of two machines are comparable). They print the same formats
+# the grader parses: the checkpatch stub reports what the native style engine finds.
+CHECKPATCH_STUB = """#!%(python)s
+import os, sys
+sys.path.insert(0, %(grader_dir)r)
+import automatic_grader
+for path in sys.argv[1:]:
+    if path.startswith("-") or not os.path.isfile(path):
+        continue
+    for finding in automatic_grader.native_style_check(path):
+        print("%%s:%%s: %%s:%%s: %%s" %% (path, finding.location.split(":")[-1], finding.kind,
+                                       finding.code, finding.message))
+"""
+
+SIM_C_STUB = """#!/bin/sh
+if [ "$1" = "-v" ]; then echo "sim_c benchmark stub"; fi
+"""
+
+CLANG_STUB = """#!%(python)s
+import json, re, sys
+if sys.argv[1:] == ["--version"]:
+    print("clang benchmark stub")
+    sys.exit(0)
+path = sys.argv[-1]
+lines = open(path, errors="replace").read().split("\\n")
+function_regex = re.compile(r'^[A-Za-z_][\\w \\t*]*?\\b([A-Za-z_]\\w*)\\s*\\(([^;]*)\\)\\s*\\{?\\s*$')
+variable_regex = re.compile(r'^\\s+(?:const\\s+)?(?:unsigned\\s+)?(?:int|char|long|double|float)\\s+\\**([A-Za-z_]\\w*)')
+declarations, offset = [], 0
+def location(line):
+    return {"offset" : offset, "file" : path, "line" : line + 1, "col" : 1, "tokLen" : 1}
+for (idx, line) in enumerate(lines):
+    match = function_regex.match(line)
+    if match is not None:
+        end = next((i for i in range(idx + 1, len(lines)) if lines[i].startswith("}")), idx)
+        inner = [{"kind" : "ParmVarDecl", "loc" : location(idx), "name" : param.split()[-1].strip("*"),
+                  "type" : {"qualType" : " ".join(param.split()[:-1])}}
+                 for param in match.group(2).split(",") if len(param.split()) > 1]
+        for body_idx in range(idx + 1, end):
+            variable = variable_regex.match(lines[body_idx])
+            if variable is not None:
+                inner.append({"kind" : "VarDecl", "loc" : location(body_idx), "name" : variable.group(1),
+                              "type" : {"qualType" : "int"}})
+        inner.append({"kind" : "CompoundStmt", "range" : {"begin" : location(idx), "end" : location(end)}})
+        declarations.append({"kind" : "FunctionDecl", "loc" : location(idx),
+                             "range" : {"begin" : location(idx), "end" : location(end)},
+                             "name" : match.group(1), "type" : {"qualType" : "int ()"}, "inner" : inner})
+    offset += len(line) + 1
+print(json.dumps({"kind" : "TranslationUnitDecl", "inner" : declarations}, indent=2))
+"""
+
+STUBS = {
+    "checkpatch.pl" : CHECKPATCH_STUB,
+    "sim_c" : SIM_C_STUB,
+    "clang" : CLANG_STUB,
+}
+
+VARIABLE_NAMES = ["total", "count", "index", "value", "result", "node", "length", "sum",
+                  "a1", "tmp", "foo", "x2", "aux"]
+README_TEXT = ("Implementarea foloseste o lista dublu inlantuita cu santinela. Fiecare operatie "
+               "este tratata intr-o functie separata, iar memoria este eliberata la final. ")
+DUPLICATED_BLOCK = [
+    "\tfor (i = 0; i < count; i++) {",
+    "\t\tif (values[i] > maximum)",
+    "\t\t\tmaximum = values[i];",
+    "\t\tif (values[i] < minimum)",
+    "\t\t\tminimum = values[i];",
+    "\t\tsum += values[i] * weight;",
+    "\t\tweight = (weight * 31 + values[i]) % 1009;",
+    "\t}",
+]
+
+def violation_lines(rng, rate, name):
+    # one randomly picked style violation known to checkpatch, or nothing
+    if rng.random() >= rate:
+        return []
+    kind = rng.choice(["spacing", "trailing", "long_line", "deep"])
+    if kind == "spacing":
+        return ["\t%s=%s+1;" % (name, name)]
+    if kind == "trailing":
+        return ["\tif (%s > 100) %s = 100;" % (name, name)]
+    if kind == "long_line":
+        return ["\t%s += values[0] * count + values[count - 1] * %d - (%s >> 2) + (count << 3) + 11111;"
+                % (name, rng.randint(100, 999), name)]
+    return ["\t" * depth + "if (%s > %d) {" % (name, depth) for depth in range(1, 8)] + \
+           ["\t" * 8 + "%s--;" % name] + ["\t" * depth + "}" for depth in range(7, 0, -1)]
+
+def c_function(rng, name, rate, duplicated):
+    variable = rng.choice(VARIABLE_NAMES)
+    lines = ["int %s(int *values, int count)" % name, "{",
+             "\tint %s = 0, i, maximum = 0, minimum = 0, sum = 0, weight = 1;" % variable, ""]
+    if duplicated:
+        lines += DUPLICATED_BLOCK
+    for step in range(rng.randint(2, 6)):
+        lines += ["\t%s += values[%d %% count] * %d;" % (variable, step, rng.randint(2, 50))]
+        lines += violation_lines(rng, rate, variable)
+    lines += ["", "\treturn %s + maximum - minimum + sum;" % variable, "}", ""]
+    return lines
+
+def c_source(rng, file_idx, args, duplicated):
+    lines = ["#include <stdio.h>", "#include <stdlib.h>", ""]
+    if rng.random() < args.violation_rate:
+        lines += ["int counter_%d = 0;" % file_idx, ""]
+    for function_idx in range(args.functions):
+        lines += c_function(rng, "compute_%d_%d" % (file_idx, function_idx), args.violation_rate,
+                            duplicated and function_idx < 2)
+    return "\n".join(lines)
+
+def run_logs(rng, args):
+    stdout, points = [], 0
+    for test in range(1, args.tests + 1):
+        stdout += ["==%d== HEAP SUMMARY: in use at exit: 0 bytes in 0 blocks" % rng.randint(1000, 9999)
+                   for noise in range(args.log_noise)]
+        passed = rng.random() < 0.8
+        if passed and rng.random() < 0.2:
+            stdout.append("Memory leaks")
+        stdout.append("Test %d ..... %s" % (test, "PASSED" if passed else "FAILED"))
+        points += 110 // args.tests if passed else 0
+    stdout.append("Total = %d" % points)
+    stderr = ["main.c:%d:5: warning: unused variable 'x%d' [-Wunused-variable]" % (line, line)
+              for line in range(rng.randint(0, 3))]
+    return "\n".join(stdout) + "\n", "\n".join(stderr) + "\n"
+
+def generate_cohort(assignment_path, args):
+    rng = random.Random(args.seed)
+    previous_sources = []
+    for student_idx in range(args.students):
+        student_path = os.path.join(assignment_path, "student%04d" % student_idx)
+        archive = os.path.join(student_path, "current", "git", "archive")
+        results = os.path.join(student_path, "current", "results")
+        os.makedirs(archive)
+        os.makedirs(results)
+
+        duplicated = rng.random() < args.duplicate_rate
+        sources = [c_source(rng, file_idx, args, duplicated) for file_idx in range(args.files)]
+        # a few students hand in a colleague's file, for the plagiarism pass
+        if previous_sources and rng.random() < args.copy_rate:
+            sources[0] = rng.choice(previous_sources)
+        previous_sources = sources
+        for (file_idx, source) in enumerate(sources):
+            with open(os.path.join(archive, "source%d.c" % file_idx), "w") as file:
+                file.write(source)
+        with open(os.path.join(archive, "common.h"), "w") as file:
+            file.write("#ifndef COMMON_H\n#define COMMON_H\n\nint compute_0_0(int *values, int count);\n\n#endif\n")
+        with open(os.path.join(archive, "Makefile"), "w") as file:
+            file.write("build:\n\tgcc -Wall -Wextra *.c -o tema\n\nclean:\n\trm -f tema\n")
+
+        readme = rng.choice(["missing", "short", "long", "feedback"])
+        if readme != "missing":
+            text = README_TEXT * (1 if readme == "short" else 12)
+            if readme == "feedback":
+                text += "\nFeedback: tema a fost interesanta.\n"
+            with open(os.path.join(archive, "README"), "w") as file:
+                file.write(text)
+        if rng.random() < 0.1:
+            with open(os.path.join(archive, "tema.o"), "wb") as file:
+                file.write(bytes(rng.getrandbits(8) for i in range(512)))
+
+        stdout, stderr = run_logs(rng, args)
+        with open(os.path.join(results, "run-stdout.vmr"), "w") as file:
+            file.write(stdout)
+        with open(os.path.join(results, "run-stderr.vmr"), "w") as file:
+            file.write(stderr)
+
+def install_stubs(bin_dir, force):
+    # -> {tool : "real" | "stub"}
+    os.makedirs(bin_dir, exist_ok=True)
+    tools = {}
+    for (tool, stub) in STUBS.items():
+        if not force and shutil.which(tool) is not None:
+            tools[tool] = "real"
+            continue
+        stub_path = os.path.join(bin_dir, tool)
+        with open(stub_path, "w") as file:
+            file.write(stub % {"python" : sys.executable, "grader_dir" : GRADER_DIR})
+        os.chmod(stub_path, 0o755)
+        tools[tool] = "stub"
+    return tools
+
+def timed_run(grader_args, work_dir, env):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, GRADER_PATH] + grader_args, cwd=work_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        sys.exit("grader failed (%s):\n%s" % (" ".join(grader_args), completed.stderr.decode(errors="replace")))
+    return seconds
+
+def startup_times(assignment_path, work_dir, env):
+    # start-up dominated invocations, the way shell loops over assignments call the grader
+    commands = {"help" : ["--help"],
+                "list" : ["list", "--assignments_path", assignment_path]}
+    return {name : seconds_summary([timed_run(grader_args, work_dir, env) for run in range(STARTUP_RUNS)])
+            for (name, grader_args) in commands.items()}
+
+def seconds_summary(runs):
+    runs = np.array(runs)
+    return {"runs" : [round(float(seconds), 3) for seconds in runs],
+            "median_seconds" : round(float(np.median(runs)), 3),
+            "min_seconds" : round(float(runs.min()), 3)}
+
+def benchmark(args):
+    work_dir = os.path.abspath(args.work_dir)
+    assignment_path = os.path.join(work_dir, "hws", args.assignment)
+    if os.path.isdir(os.path.join(work_dir, "hws")):
+        shutil.rmtree(os.path.join(work_dir, "hws"))
+    generate_cohort(assignment_path, args)
+
+    tools = install_stubs(os.path.join(work_dir, "bin"), args.stub_tools)
+    env = dict(os.environ, PATH=os.path.join(work_dir, "bin") + os.pathsep + os.environ.get("PATH", ""))
+    extra_args = shlex.split(args.grader_args)
+    common_args = ["--assignments_path", assignment_path, "--no-cache"] + extra_args
+
+    grade_runs, stat_runs = [], []
+    stages = {}
+    for repeat in range(args.repeat):
+        grade_folder = os.path.join(work_dir, "grades")
+        if os.path.isdir(grade_folder):
+            shutil.rmtree(grade_folder)
+        os.makedirs(grade_folder)
+        profile_path = os.path.join(work_dir, "profile.json")
+        grade_runs.append(timed_run(common_args + ["--grade", grade_folder, "--profile", profile_path],
+                                    work_dir, env))
+        with open(profile_path) as file:
+            for (stage, totals) in json.load(file)["stages"].items():
+                stages.setdefault(stage, []).append(totals)
+        stat_runs.append(timed_run(common_args + ["--stat"], work_dir, env))
+
+    return {
+        "config" : {"students" : args.students, "files" : args.files, "functions" : args.functions,
+                    "tests" : args.tests, "log_noise" : args.log_noise, "seed" : args.seed,
+                    "violation_rate" : args.violation_rate, "duplicate_rate" : args.duplicate_rate,
+                    "copy_rate" : args.copy_rate, "repeat" : args.repeat, "grader_args" : extra_args},
+        "environment" : {"python" : platform.python_version(), "platform" : platform.platform(),
+                         "cpu_count" : os.cpu_count(), "tools" : tools},
+        "grade" : seconds_summary(grade_runs),
+        "stat" : seconds_summary(stat_runs),
+        "startup" : startup_times(assignment_path, work_dir, env),
+        "stages" : {stage : {"calls" : runs[0]["calls"],
+                             "median_total_seconds" : round(float(np.median([run["total_seconds"] for run in runs])), 3),
+                             "median_p95_seconds" : round(float(np.median([run["p95_seconds"] for run in runs])), 3)}
+                    for (stage, runs) in sorted(stages.items())},
+    }
+
+def compare(baseline, current):
+    rows = [("grade", baseline["grade"]["median_seconds"], current["grade"]["median_seconds"]),
+            ("stat", baseline["stat"]["median_seconds"], current["stat"]["median_seconds"])]
+    for command in sorted(current["startup"]):
+        rows.append(("startup " + command, baseline.get("startup", {}).get(command, {}).get("min_seconds"),
+                     current["startup"][command]["min_seconds"]))
+    for stage in sorted(set(baseline["stages"]) | set(current["stages"])):
+        rows.append((stage, baseline["stages"].get(stage, {}).get("median_total_seconds"),
+                     current["stages"].get(stage, {}).get("median_total_seconds")))
+
+    if baseline["config"] != current["config"]:
+        print("warning: the baseline was measured with a different configuration")
+    print("%-32s %10s %10s %8s" % ("", "baseline", "current", "ratio"))
+    for (name, before, after) in rows:
+        ratio = "%7.2fx" % (after / before) if before and after is not None else "-"
+        print("%-32s %10s %10s %8s" % (name, "-" if before is None else "%.3fs" % before,
+                                       "-" if after is None else "%.3fs" % after, ratio))
+
+def main():
+    parser = argparse.ArgumentParser(description='Times every assessment stage and the end to end \
+            grade & stat runs of the automatic grader on a generated cohort.')
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--files", type=int, default=3, help="C sources per student.")
+    parser.add_argument("--functions", type=int, default=8, help="Functions per source.")
+    parser.add_argument("--tests", type=int, default=10, help="Tests in every run-stdout.vmr log.")
+    parser.add_argument("--log_noise", type=int, default=20, metavar='lines',
+                        help="Valgrind-like lines logged before every test result.")
+    parser.add_argument("--violation_rate", type=float, default=0.3,
+                        help="Chance of a style violation after every generated statement.")
+    parser.add_argument("--duplicate_rate", type=float, default=0.3,
+                        help="Share of students with a block duplicated across their functions.")
+    parser.add_argument("--copy_rate", type=float, default=0.05,
+                        help="Share of students handing in a source of the previous student.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--assignment", default="1-list")
+    parser.add_argument("--work_dir", default="benchmark-work", metavar='dir',
+                        help="Where the cohort, the stub tools and the grades are written.")
+    parser.add_argument("--stub_tools", action='store_true',
+                        help="Use the stub checkers even when checkpatch/sim_c/clang are installed.")
+    parser.add_argument("--grader_args", default="", metavar='args',
+                        help="Extra arguments for every grader run, e.g. \"--jobs 4 --style-engine native\".")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark.json", metavar='file')
+    parser.add_argument("--compare", default=None, metavar='baseline',
+                        help="A previous --output to compare this run against.")
+
+    args = parser.parse_args()
+
+    results = benchmark(args)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=1)
+    print("grade %.3fs  stat %.3fs (median of %d)  start-up: list %.3fs (min of %d) -> %s" % (
+          results["grade"]["median_seconds"], results["stat"]["median_seconds"], args.repeat,
+          results["startup"]["list"]["min_seconds"], STARTUP_RUNS, args.output))
+    if args.compare is not None:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+
+if __name__ == "__main__":
+    main()
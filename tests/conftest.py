@@ -0,0 +1,14 @@
+import os
+import sys
+
+# the grader is a script module at the top of the repository, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import automatic_grader as ag
+
+@pytest.fixture
+def default_rubric():
+    ag.apply_rubric(ag.load_rubric(ag.RUBRIC_FILE))
+    return ag.rubric
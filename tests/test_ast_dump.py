@@ -0,0 +1,205 @@
+import automatic_grader as ag
+
+# clang -Xclang -ast-dump=json -fsyntax-only main.c, trimmed: an implicit builtin typedef, a
+# declaration coming from a system header and the two main file declarations. Locations only
+# repeat the file/line when they change from the previously printed one.
+AST_DUMP = b"""{
+  "id": "0x55d0c1a3e0a8",
+  "kind": "TranslationUnitDecl",
+  "loc": {},
+  "range": {
+    "begin": {},
+    "end": {}
+  },
+  "inner": [
+    {
+      "id": "0x55d0c1a3e940",
+      "kind": "TypedefDecl",
+      "loc": {},
+      "range": {
+        "begin": {},
+        "end": {}
+      },
+      "isImplicit": true,
+      "name": "__int128_t",
+      "type": {
+        "qualType": "__int128"
+      }
+    },
+    {
+      "id": "0x55d0c1aa1c30",
+      "kind": "FunctionDecl",
+      "loc": {
+        "offset": 12735,
+        "file": "/usr/include/stdio.h",
+        "line": 356,
+        "col": 12,
+        "tokLen": 6,
+        "includedFrom": {
+          "file": "/hw/main.c"
+        }
+      },
+      "range": {
+        "begin": {
+          "offset": 12724,
+          "col": 1,
+          "tokLen": 6
+        },
+        "end": {
+          "offset": 12790,
+          "line": 357,
+          "col": 47,
+          "tokLen": 1
+        }
+      },
+      "name": "printf",
+      "mangledName": "printf",
+      "type": {
+        "qualType": "int (const char *restrict, ...)"
+      },
+      "storageClass": "extern",
+      "variadic": true
+    },
+    {
+      "id": "0x55d0c1aa2f18",
+      "kind": "VarDecl",
+      "loc": {
+        "offset": 24,
+        "file": "/hw/main.c",
+        "line": 2,
+        "col": 5,
+        "tokLen": 5
+      },
+      "range": {
+        "begin": {
+          "offset": 20,
+          "col": 1,
+          "tokLen": 3
+        },
+        "end": {
+          "offset": 32,
+          "col": 13,
+          "tokLen": 1
+        }
+      },
+      "name": "total",
+      "type": {
+        "qualType": "int"
+      },
+      "init": "c"
+    },
+    {
+      "id": "0x55d0c1aa3050",
+      "kind": "FunctionDecl",
+      "loc": {
+        "offset": 39,
+        "line": 3,
+        "col": 5,
+        "tokLen": 4
+      },
+      "range": {
+        "begin": {
+          "offset": 35,
+          "col": 1,
+          "tokLen": 3
+        },
+        "end": {
+          "offset": 105,
+          "line": 6,
+          "col": 1,
+          "tokLen": 1
+        }
+      },
+      "name": "main",
+      "type": {
+        "qualType": "int (void)"
+      },
+      "inner": [
+        {
+          "id": "0x55d0c1aa3208",
+          "kind": "CompoundStmt",
+          "range": {
+            "begin": {
+              "offset": 50,
+              "line": 3,
+              "col": 16,
+              "tokLen": 1
+            },
+            "end": {
+              "offset": 105,
+              "line": 6,
+              "col": 1,
+              "tokLen": 1
+            }
+          },
+          "inner": [
+            {
+              "id": "0x55d0c1aa3180",
+              "kind": "DeclStmt",
+              "range": {
+                "begin": {
+                  "offset": 53,
+                  "line": 4,
+                  "col": 2,
+                  "tokLen": 3
+                },
+                "end": {
+                  "offset": 66,
+                  "col": 15,
+                  "tokLen": 1
+                }
+              },
+              "inner": [
+                {
+                  "id": "0x55d0c1aa3100",
+                  "kind": "VarDecl",
+                  "loc": {
+                    "offset": 57,
+                    "col": 6,
+                    "tokLen": 5
+                  },
+                  "range": {
+                    "begin": {
+                      "offset": 53,
+                      "col": 2,
+                      "tokLen": 3
+                    },
+                    "end": {
+                      "offset": 65,
+                      "col": 14,
+                      "tokLen": 1
+                    }
+                  },
+                  "name": "count",
+                  "type": {
+                    "qualType": "int"
+                  },
+                  "init": "c"
+                }
+              ]
+            }
+          ]
+        }
+      ]
+    }
+  ]
+}
+"""
+
+def parse(dump):
+    feed, functions, variables = ag.ast_dump_parser("/hw/main.c")
+    for line in dump.splitlines(True):
+        feed(line)
+    return functions, variables
+
+def test_main_file_declarations():
+    functions, variables = parse(AST_DUMP)
+    assert functions == [ag.FunctionDetails("/hw/main.c", 3, 3, "main", "int (void)")]
+    assert variables == [ag.VariableDetails("/hw/main.c", 2, "total", "int"),
+                         ag.VariableDetails("/hw/main.c", 4, "count", "int")]
+
+def test_crlf_and_truncated_dump():
+    # a dump cut short (clang killed) keeps the declarations completed before the cut
+    functions, variables = parse(AST_DUMP[:AST_DUMP.index(b'"name": "main"')].replace(b"\n", b"\r\n"))
+    assert functions == []
+    assert variables == [ag.VariableDetails("/hw/main.c", 2, "total", "int")]
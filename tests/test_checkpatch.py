@@ -0,0 +1,38 @@
+import os
+
+import automatic_grader as ag
+
+def parse(files_paths, output):
+    feed, findings = ag.checkpatch_output_parser(files_paths)
+    for line in output.splitlines(True):
+        feed(line)
+    return {path : [finding.as_list() for finding in file_findings] for (path, file_findings) in findings.items()}
+
+def test_terse_lines():
+    findings = parse(["/hw/a.c", "/hw/b.c"],
+                     b"/hw/a.c:12: WARNING:LONG_LINE: line length of 90 exceeds 80 columns\n"
+                     b"/hw/b.c:3: ERROR:SPACING: space required after that ',' (ctx:VxV)\r\n"
+                     b"/hw/a.c:40: ERROR:TRAILING_WHITESPACE:\n"
+                     b"total: 2 errors, 1 warnings, 50 lines checked\n"
+                     b"\n")
+    assert findings == {
+        "/hw/a.c" : [["a.c:12", "WARNING", "LONG_LINE", "line length of 90 exceeds 80 columns"],
+                     ["a.c:40", "ERROR", "TRAILING_WHITESPACE", ""]],
+        "/hw/b.c" : [["b.c:3", "ERROR", "SPACING", "space required after that ',' (ctx:VxV)"]],
+    }
+
+def test_files_outside_the_batch_are_ignored():
+    assert parse(["/hw/a.c"], b"/other/a.c:1: WARNING:LONG_LINE: x\n/hw/a.c.orig:2: ERROR:SPACING: y\n") == \
+        {"/hw/a.c" : []}
+
+def test_undecodable_bytes():
+    path = os.fsdecode(b"/hw/fi\xe9ier.c")
+    findings = parse([path], b"/hw/fi\xe9ier.c:7: WARNING:TYPO_SPELLING: 'recieve' \xff may be misspelled\n")
+    assert findings == {path : [[os.fsdecode(b"fi\xe9ier.c") + ":7", "WARNING", "TYPO_SPELLING",
+                                 "'recieve' � may be misspelled"]]}
+
+def test_findings_round_trip_through_the_cache():
+    finding = ag.CheckpatchFinding("a.c:1", "WARNING", "LONG_LINE", "too long")
+    copy = ag.CheckpatchFinding(*finding.as_list())
+    assert copy.as_list() == finding.as_list()
+    assert copy.code is finding.code
@@ -0,0 +1,44 @@
+import automatic_grader as ag
+
+FUNCTION = """int find(int *values, int count, int wanted)
+{
+	for (int i = 0; i < count; i++) {
+		if (values[i] == wanted)
+			return i;
+	}
+	return -1;
+}
+"""
+
+def write_archive(tmp_path, files):
+    archive = tmp_path / "archive"
+    for (name, source) in files.items():
+        (archive / name).parent.mkdir(parents=True, exist_ok=True)
+        (archive / name).write_text(source)
+    return str(archive) + "/"
+
+def test_copy_across_files(tmp_path):
+    archive = write_archive(tmp_path, {"a.c" : FUNCTION, "b.c" : "int x;\n" + FUNCTION.replace("find", "search")})
+    summaries = ag.find_duplicated_runs(archive)
+    assert len(summaries) == 1
+    assert (summaries[0].file1, summaries[0].lines1) == ("a.c", (1, 8))
+    assert (summaries[0].file2, summaries[0].lines2) == ("b.c", (2, 9))
+
+def test_copy_inside_one_file(tmp_path):
+    archive = write_archive(tmp_path, {"main.c" : FUNCTION + "\n" + FUNCTION.replace("find", "find2")})
+    summaries = ag.find_duplicated_runs(archive)
+    assert [(summary.file1, summary.lines1, summary.file2, summary.lines2) for summary in summaries] == \
+        [("main.c", (1, 8), "main.c", (10, 17))]
+
+def test_sources_in_subdirectories_only(tmp_path):
+    archive = write_archive(tmp_path, {"src/a.c" : FUNCTION, "lib/b.h" : FUNCTION, "notes.txt" : FUNCTION})
+    summaries = ag.find_duplicated_runs(archive)
+    assert [(summary.file1, summary.file2) for summary in summaries] == [("lib/b.h", "src/a.c")]
+
+def test_nothing_to_compare(tmp_path):
+    assert ag.find_duplicated_runs(write_archive(tmp_path, {"a.c" : "int x;\n", "b.h" : ""})) == []
+
+def test_inventory_files_match_os_walk(tmp_path):
+    archive = write_archive(tmp_path, {"a.c" : "", "README" : "", "src/b.c" : "", "src/deep/c.h" : ""})
+    (tmp_path / "archive" / "link").symlink_to(tmp_path / "archive" / "src")
+    assert ag.archive_inventory(archive).files == ag.list_files_recursive(archive)
@@ -0,0 +1,112 @@
+import automatic_grader as ag
+
+OLD_GRADE = ("-1.0: teste picate\n"
+             "\n"
+             "-0.0: valori/logica hard-coded OK\n"
+             "-0.1: cod nefolosit                     " + ag.MANUAL_TAG + "\n"
+             "RAA\n")
+
+NEW_GRADE = ("-0.5: teste picate\n"
+             "\n"
+             "-0.1: valori/logica hard-coded          " + ag.MANUAL_TAG + "\n"
+             "-0.1: cod nefolosit                     " + ag.MANUAL_TAG + "\n"
+             "RAA\n")
+
+def test_annotations_are_kept(default_rubric):
+    assert ag.keep_manual_annotations(OLD_GRADE, NEW_GRADE) == ("-0.5: teste picate\n"
+                                                                "\n"
+                                                                "-0.0: valori/logica hard-coded OK\n"
+                                                                "-0.1: cod nefolosit                     "
+                                                                + ag.MANUAL_TAG + "\n"
+                                                                "RAA\n")
+
+def test_grade_without_manual_section(default_rubric):
+    assert ag.keep_manual_annotations("[TODO check manually] grader crashed\nRAA\n", NEW_GRADE) == NEW_GRADE
+    assert ag.keep_manual_annotations(OLD_GRADE, "-0.5: teste picate\nRAA\n") == "-0.5: teste picate\nRAA\n"
+
+def manual_lines(*checks):
+    return "".join(check + " " * (40 - len(check)) + ag.MANUAL_TAG + "\n" for check in checks)
+
+def test_naming_checks_come_back_without_an_ast(default_rubric):
+    # automated namings -> fallback: the naming checks come back with their defaults
+    old_grade = ("-0.1: nume variabile/functii inadecvate (tmp, aux)\n"
+                 "\n"
+                 "-0.0: valori/logica hard-coded OK\n" +
+                 manual_lines("-0.1: impartit ilogic in functii", "-0.1: cod nefolosit") +
+                 "-0.2: memorie nealocata dinamic\n"
+                 "RAA\n")
+    new_grade = ("\n" +
+                 manual_lines("-0.1: valori/logica hard-coded", "-0.1: nume variabile/functii inadecvate",
+                              "-0.1: impartit ilogic in functii", "-0.1: functii kilometrice",
+                              "-0.1: cod nefolosit") +
+                 "RAA\n")
+    assert ag.keep_manual_annotations(old_grade, new_grade) == (
+        "\n"
+        "-0.0: valori/logica hard-coded OK\n" +
+        manual_lines("-0.1: nume variabile/functii inadecvate", "-0.1: impartit ilogic in functii",
+                     "-0.1: functii kilometrice", "-0.1: cod nefolosit") +
+        "-0.2: memorie nealocata dinamic\n"
+        "RAA\n")
+
+def test_naming_checks_are_dropped_once_automated(default_rubric):
+    # fallback -> automated namings: the TA's naming answers go, the other annotations stay
+    old_grade = ("\n"
+                 "-0.0: valori/logica hard-coded OK\n"
+                 "-0.0: nume variabile/functii inadecvate ok\n"
+                 "-0.2: functii kilometrice (main 200 linii)\n" +
+                 manual_lines("-0.1: impartit ilogic in functii") +
+                 "-0.0: cod nefolosit\n"
+                 "RAA\n")
+    new_grade = ("-0.1: functii kilometrice (main)\n"
+                 "\n" +
+                 manual_lines("-0.1: valori/logica hard-coded", "-0.1: impartit ilogic in functii",
+                              "-0.1: cod nefolosit") +
+                 "RAA\n")
+    assert ag.keep_manual_annotations(old_grade, new_grade) == ("-0.1: functii kilometrice (main)\n"
+                                                                "\n"
+                                                                "-0.0: valori/logica hard-coded OK\n" +
+                                                                manual_lines("-0.1: impartit ilogic in functii") +
+                                                                "-0.0: cod nefolosit\n"
+                                                                "RAA\n")
+
+def test_naming_fallback_annotations_are_kept(tmp_path, monkeypatch, default_rubric):
+    # without an AST the naming checks are left to the TA, in the section a regrade keeps
+    monkeypatch.setattr(ag, "grading_stages", [ag.asses_vars_and_funcs_namings, ag.assess_manual_only_checkables])
+    monkeypatch.setattr(ag, "extract_archive_ast", lambda path: ([], []))
+    grades = tmp_path / "grades"
+    grades.mkdir()
+    ag.process_student(str(tmp_path / "hws" / "alice"), "RAA", str(grades), verbose = False)
+    grade_path = grades / "alice"
+    edited = grade_path.read_text().replace("-0.1: functii kilometrice", "-0.0: functii kilometrice (ok)")
+    grade_path.write_text(edited)
+
+    ag.process_student(str(tmp_path / "hws" / "alice"), "RAA", str(grades), verbose = False, keep_annotations = True)
+    assert grade_path.read_text() == edited
+    assert "-0.0: functii kilometrice (ok)" in edited
+
+def test_crash_replaces_the_previous_grade(tmp_path, monkeypatch, default_rubric):
+    def crash(grade_file, student_hw_path, verbose):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(ag, "grading_stages", [ag.assess_leaks_failed_tests, crash])
+    grades = tmp_path / "grades"
+    grades.mkdir()
+    (grades / "alice").write_text("OLD STALE GRADE\n")
+    job = ag.GradeJob(0, str(tmp_path / "hws" / "alice"), "RAA", str(grades), False, False, False)
+    for i in range(2):
+        job, console, error, profile, record = ag.grade_student_job(job)
+    assert error == "RuntimeError: boom"
+    assert (grades / "alice").read_text() == ("-11.0: teste picate\n"
+                                                "[TODO check manually] grader crashed (RuntimeError: boom)\n"
+                                                "RAA\n")
+    assert record["total"] is None
+    assert record["todo"] == ["grader crashed (RuntimeError: boom)"]
+
+def test_fingerprint_of_a_broken_archive(tmp_path):
+    archive = tmp_path / "alice" / "current" / "git" / "archive"
+    archive.mkdir(parents=True)
+    (archive / "main.c").write_text("int main(void) { return 0; }\n")
+    (archive / "list.h").symlink_to(tmp_path / "missing.h")
+    fingerprint = ag.student_fingerprint(str(tmp_path / "alice"), "RAA", "rubric")
+    assert fingerprint == ag.student_fingerprint(str(tmp_path / "alice"), "RAA", "rubric")
+    (tmp_path / "missing.h").write_text("#define LEN 0\n")
+    assert ag.student_fingerprint(str(tmp_path / "alice"), "RAA", "rubric") != fingerprint
@@ -0,0 +1,46 @@
+import automatic_grader as ag
+
+# one finding for every penalised code, the long lines fall between 80 and checkpatch's default 100
+LINT_SOURCE = (
+    "int counter = 0;\n"
+    "\n"
+    "int sum(int a,int b)\n"
+    "{\n"
+    "\tint s=a + b;\n"
+    "\tif (s > 10) s = 10;\n"
+    "\t/* this comment keeps going well past the eighty columns that the rubric allows */\n"
+    "\treturn s + a + b + a * b + a * a + b * b + (a - b) * (a - b) + counter + counter;\n"
+    "}\n"
+    "\n"
+    "void deep(int n)\n"
+    "{\n"
+    "\tif (n) {\n"
+    "\t\tif (n) {\n"
+    "\t\t\tif (n) {\n"
+    "\t\t\t\tif (n) {\n"
+    "\t\t\t\t\tif (n) {\n"
+    "\t\t\t\t\t\tif (n)\n"
+    "\t\t\t\t\t\t\tn--;\n"
+    "\t\t\t\t\t}\n"
+    "\t\t\t\t}\n"
+    "\t\t\t}\n"
+    "\t\t}\n"
+    "\t}\n"
+    "}\n"
+)
+
+def test_penalised_codes(tmp_path):
+    (tmp_path / "lint.c").write_text(LINT_SOURCE)
+    findings = [finding.as_list()[:3] for finding in ag.native_style_check(str(tmp_path / "lint.c"))]
+    assert findings == [["lint.c:1", "ERROR", "GLOBAL_INITIALISERS"],
+                        ["lint.c:3", "ERROR", "SPACING"],
+                        ["lint.c:5", "ERROR", "SPACING"],
+                        ["lint.c:6", "ERROR", "TRAILING_STATEMENTS"],
+                        ["lint.c:7", "WARNING", "LONG_LINE_COMMENT"],
+                        ["lint.c:8", "WARNING", "LONG_LINE"],
+                        ["lint.c:18", "WARNING", "DEEP_INDENTATION"]]
+    assert sorted(set(finding[2] for finding in findings)) == ag.NATIVE_STYLE_CODES
+
+def test_checkpatch_uses_the_same_line_length():
+    with open(ag.CHECKPATCH_WRAPPER) as wrapper:
+        assert "--max-line-length=%d" % (ag.STYLE_MAX_LINE_LENGTH) in wrapper.read()
@@ -0,0 +1,41 @@
+import automatic_grader as ag
+
+SHARED_CODE = """
+int sum(int *values, int count)
+{
+    int total = 0;
+    for (int i = 0; i < count; i++)
+        total += values[i];
+    return total;
+}
+"""
+
+def write_archive(root, student, files):
+    archive = root / student / "current" / "git" / "archive"
+    archive.mkdir(parents=True)
+    for (name, source) in files.items():
+        (archive / name).write_text(source)
+    return str(root / student)
+
+def test_winnow_of_no_hashes():
+    assert ag.winnow([], ag.PLAGIARISM_WINDOW) == []
+
+def test_source_shorter_than_one_kgram(tmp_path):
+    header = tmp_path / "list.h"
+    header.write_text("int f(void);\n")
+    assert ag.source_fingerprints(str(header)) == []
+
+def test_student_with_small_header(tmp_path):
+    stud_path = write_archive(tmp_path, "alice", {"list.h" : "int f(void);\n", "list.c" : SHARED_CODE})
+    stud_path, fingerprints = ag.student_fingerprints(stud_path)
+    assert fingerprints["list.h"] == []
+    assert fingerprints["list.c"]
+
+def test_shared_code_shares_a_fingerprint(tmp_path):
+    first = tmp_path / "a.c"
+    second = tmp_path / "b.c"
+    first.write_text("int unrelated = 1;\n" + SHARED_CODE)
+    second.write_text("char *other(void) { return 0; }\n" + SHARED_CODE.replace("total", "acc"))
+    first_fingerprints = {fingerprint for (fingerprint, start, end) in ag.source_fingerprints(str(first))}
+    second_fingerprints = {fingerprint for (fingerprint, start, end) in ag.source_fingerprints(str(second))}
+    assert first_fingerprints & second_fingerprints
@@ -0,0 +1,48 @@
+import json
+
+import automatic_grader as ag
+
+def occurrences(count):
+    return [("main.c:%d" % (line),) for line in range(1, count + 1)]
+
+def test_override_is_merged_per_key(tmp_path):
+    (tmp_path / ag.ASSIGNMENT_RUBRIC_FILE).write_text(json.dumps({
+        "style" : {"LONG_LINE" : {"penalty" : 0.3}},
+        "manual_checks" : {"long_functions" : "-0.2: functii prea lungi", "unused_code" : None},
+    }))
+    compiled = ag.compile_rubric(ag.load_rubric(ag.RUBRIC_FILE, str(tmp_path)))
+    assert compiled["rules"]["style:LONG_LINE"] == ag.RubricRule("linii peste 80 de caractere", 0.3, 4, False)
+    checks = dict(compiled["manual_checks"])
+    assert checks["long_functions"] == "-0.2: functii prea lungi"
+    assert "unused_code" not in checks
+    assert "long_functions" in compiled["naming_manual_checks"]
+
+def test_thresholds(default_rubric):
+    duplication = default_rubric["rules"]["duplication"]
+    assert ag.rule_penalty(duplication, 50) == 0.0
+    assert ag.rule_penalty(duplication, 51) == 0.2
+    # the README size in bytes is the count of an at_most rule
+    readme = default_rubric["rules"]["readme"]
+    assert ag.rule_applies(readme, 1024)
+    assert not ag.rule_applies(readme, 1025)
+
+def test_style_penalties_are_capped(default_rubric):
+    sheet = ag.GradeSheet()
+    warnings = {"LONG_LINE" : occurrences(5), "GLOBAL_INITIALISERS" : occurrences(3), "UNKNOWN_CODE" : occurrences(9)}
+    errors = {"SPACING" : occurrences(11), "TRAILING_STATEMENTS" : occurrences(5)}
+    total = ag.output_check_summary(sheet, [warnings, errors], 0.5)
+    assert [(record.category, record.penalty) for record in sheet.records] == [
+        ("style:LONG_LINE", -0.1), ("style:GLOBAL_INITIALISERS", -0.2), ("style:SPACING", -0.1),
+        ("style:TRAILING_STATEMENTS", -0.1)]
+    assert round(total, 1) == 0.5
+
+    sheet = ag.GradeSheet()
+    errors["DEEP_INDENTATION"] = occurrences(4)
+    ag.output_check_summary(sheet, [warnings, errors], 0.5)
+    assert sheet.records[-1] == ag.GradeRecord("style:DEEP_INDENTATION", 0.0, 4, sheet.records[-1].examples)
+
+def test_fingerprint_follows_the_rubric(default_rubric):
+    before = ag.rubric_fingerprint()
+    spec = ag.merge_rubric(default_rubric["spec"], {"duplication" : {"threshold" : 80}})
+    ag.apply_rubric(spec)
+    assert ag.rubric_fingerprint() != before
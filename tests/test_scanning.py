@@ -0,0 +1,54 @@
+import io
+import random
+
+import automatic_grader as ag
+
+def mapped(tmp_path, data):
+    path = tmp_path / "scanned"
+    path.write_bytes(data)
+    return ag.mapped_file(str(path))
+
+def test_lines_match_readline(tmp_path, monkeypatch):
+    monkeypatch.setattr(ag, "SCAN_WINDOW", 4096)
+    generator = random.Random(21)
+    for i in range(50):
+        data = b"".join(generator.choice([b"short\n", b"\n", b"z" * 5000 + b"\n", b"tail"])
+                        for j in range(generator.randint(0, 40)))
+        stream = io.BytesIO(data)
+        expected = list(iter(lambda: stream.readline(1024), b""))
+        with mapped(tmp_path, data) as scanned:
+            assert list(ag.mapped_lines(scanned, 1024)) == expected
+            if data:
+                assert ag.mapped_last_line(scanned, 1024) == io.BytesIO(data).readlines()[-1].rstrip(b"\n")[-1024:]
+
+def test_search_across_windows(tmp_path, monkeypatch):
+    monkeypatch.setattr(ag, "SCAN_WINDOW", 4096)
+    for position in [0, 4090, 4096, 3 * 4096 - 3, 5 * 4096]:
+        data = b"x" * position + b"FeedBack" + b"y" * 5000
+        with mapped(tmp_path, data) as scanned:
+            assert ag.mapped_search(scanned, ag.readme_feedback_regex)
+    with mapped(tmp_path, b"feed back\n" * 2000) as scanned:
+        assert not ag.mapped_search(scanned, ag.readme_feedback_regex)
+
+def test_empty_file(tmp_path):
+    with mapped(tmp_path, b"") as scanned:
+        assert list(ag.mapped_lines(scanned)) == []
+        assert ag.mapped_count_lines_with(scanned, b"warning:") == 0
+        assert not ag.mapped_search(scanned, ag.readme_feedback_regex)
+
+def test_readme(tmp_path):
+    (tmp_path / "main.c").write_text("int main(void) { return 0; }\n")
+    (tmp_path / "README").write_text("Implementare...\n\nFEEDBACK: tema ok\n")
+    assert ag.check_for_readme(str(tmp_path)) == (len("Implementare...\n\nFEEDBACK: tema ok\n"), True)
+    (tmp_path / "README").write_text("")
+    ag.archive_inventories.clear()
+    assert ag.check_for_readme(str(tmp_path)) == (0, False)
+
+def test_clang_cache_key_covers_the_headers(tmp_path):
+    (tmp_path / "main.c").write_text('#include "list.h"\nint main(void) { return LEN; }\n')
+    (tmp_path / "list.h").write_text("#define LEN 0\n")
+    ag.archive_inventories.clear()
+    main = str(tmp_path / "main.c")
+    before = ag.cache_key("clang", ag.CLANG_AST_FLAGS, ag.clang_cache_paths(main))
+    (tmp_path / "list.h").write_text("#define LEN 1\n")
+    assert ag.cache_key("clang", ag.CLANG_AST_FLAGS, ag.clang_cache_paths(main)) != before
@@ -0,0 +1,27 @@
+import asyncio
+import sys
+
+import pytest
+
+import automatic_grader as ag
+
+@pytest.fixture
+def probe_limits(monkeypatch):
+    monkeypatch.setitem(ag.TOOL_LIMITS, "probe", ag.ToolLimits(30, 1, 1 << 30, 1 << 20))
+
+def test_rlimits_are_set_before_exec(probe_limits):
+    output, exit_code = ag.run_tool("probe", ["sh", "-c", "ulimit -S -t; ulimit -H -t; ulimit -v"])
+    assert (output, exit_code) == (b"1\n2\n1048576\n", 0)
+
+def test_rlimits_of_prefetched_runs(probe_limits):
+    output, exit_code = asyncio.run(ag.run_tool_async(asyncio.Semaphore(1), "probe",
+                                                      ["sh", "-c", "ulimit -S -t; ulimit -v"]))
+    assert (output, exit_code) == (b"1\n1048576\n", 0)
+
+def test_cpu_limit(probe_limits):
+    with pytest.raises(ag.ToolFailure, match="probe used more than 1s of CPU time"):
+        ag.run_tool("probe", [sys.executable, "-c", "while True: pass"])
+
+def test_missing_tool(probe_limits):
+    with pytest.raises(FileNotFoundError):
+        ag.run_tool("probe", ["no-such-checker"])
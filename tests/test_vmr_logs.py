@@ -0,0 +1,63 @@
+import io
+import random
+
+import pytest
+
+import automatic_grader as ag
+
+RUN_LOG = (b"Test 1 ..... PASSED\n"
+           b"Memory leaks\n"
+           b"Test 2 ..... PASSED\n"
+           b"Memory leaks\r\n"
+           b"Test 3 ..... PASSED\n"
+           b"Memory leaks\n"
+           b"Test 4 ..... FAILED\n"
+           b"Total = 80\n")
+
+LOG_PIECES = [b"Test 1 ..... PASSED\n", b"Test 2 ..... FAILED\n", b"Memory leaks\n", b"Memory leaks\r\n",
+              b"x" * 70000 + b"\n", b"a.c:1: warning: unused\n", b"warn", b"ing: split\n", b"\n",
+              b"a.c: warning: one warning: two\n", b"y" * 3000]
+
+def write_log(tmp_path, data):
+    path = tmp_path / "run.vmr"
+    path.write_bytes(data)
+    return str(path)
+
+def reference_log(data):
+    # the readlines() based readers the log scanning replaced
+    lines = io.BytesIO(data).readlines()
+    try:
+        points = int(lines[-1].split(b"=")[1])
+    except (ValueError, IndexError):
+        return 0, 0, sum(b"warning:" in line for line in lines)
+    leaks = sum(1 for (line, next_line) in zip(lines, lines[1:])
+                if line in (b"Memory leaks\n", b"Memory leaks\r\n") and b"PASSED" in next_line)
+    return points, leaks, sum(b"warning:" in line for line in lines)
+
+def test_run_log(tmp_path):
+    points, leaks, tests = ag.scan_run_output(write_log(tmp_path, RUN_LOG))
+    assert (points, leaks) == (80, 2)
+    assert tests == {"Test 1" : True, "Test 2" : True, "Test 3" : True, "Test 4" : False}
+
+@pytest.mark.parametrize("data", [b"", b"\n", b"Total = 90", b"no total line\n"])
+def test_short_logs(tmp_path, data):
+    points, leaks, tests = ag.scan_run_output(write_log(tmp_path, data))
+    assert (points, leaks) == reference_log(data)[:2]
+    assert ag.compile_warnings(write_log(tmp_path, data)) == 0
+
+def test_missing_logs(tmp_path):
+    assert ag.scan_run_output(str(tmp_path / "missing.vmr")) == (0, 0, {})
+    assert ag.compile_warnings(str(tmp_path / "missing.vmr")) == 0
+
+def test_random_logs(tmp_path, monkeypatch):
+    # a window of one page makes every log cross many windows & released ranges
+    monkeypatch.setattr(ag, "SCAN_WINDOW", 4096)
+    generator = random.Random(8)
+    for i in range(200):
+        data = b"".join(generator.choice(LOG_PIECES) for j in range(generator.randint(0, 60)))
+        if generator.random() < 0.8:
+            data += b"Total = %d\n" % (generator.randint(0, 110))
+        path = write_log(tmp_path, data)
+        points, leaks, warnings = reference_log(data)
+        assert ag.scan_run_output(path)[:2] == (points, leaks)
+        assert ag.compile_warnings(path) == warnings